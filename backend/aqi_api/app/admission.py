@@ -0,0 +1,113 @@
+# app/admission.py
+import asyncio
+import math
+import os
+import time
+
+# Presupuesto hacia OpenAQ: ritmo sostenido (req/s) y ráfaga máxima
+OPENAQ_RATE_PER_S = float(os.getenv("OPENAQ_RATE_PER_S", "8"))
+OPENAQ_BURST = int(os.getenv("OPENAQ_BURST", "16"))
+# Cola de espera acotada: cuántos requests pueden esperar turno y cuánto como máximo
+OPENAQ_QUEUE_SIZE = int(os.getenv("OPENAQ_QUEUE_SIZE", "32"))
+OPENAQ_QUEUE_TIMEOUT_S = float(os.getenv("OPENAQ_QUEUE_TIMEOUT_S", "1.5"))
+# Requests concurrentes por endpoint pesado de la API (/aqi, /aqi/batch); 0 = sin límite
+API_MAX_INFLIGHT = int(os.getenv("API_MAX_INFLIGHT", "256"))
+
+
+class UpstreamBusy(Exception):
+    """El presupuesto hacia upstream está agotado; reintentar después de `retry_after` s."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"OpenAQ saturado, reintentar en {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+    @property
+    def retry_after_header(self) -> str:
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+class TokenBucket:
+    """
+    Token bucket con reservas: quien no encuentra token reserva el próximo
+    (el saldo puede quedar negativo) y sabe exactamente cuánto esperar.
+    Usarlo desde el event loop (no es thread-safe).
+    """
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self) -> float:
+        """Toma un token (o reserva el próximo) y devuelve los segundos a esperar."""
+        self._refill()
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def cancel(self):
+        """Devuelve una reserva que no se va a usar."""
+        self.tokens += 1
+
+
+class AdmissionController:
+    """
+    Control de admisión hacia OpenAQ: token bucket para el ritmo upstream más
+    una cola de espera acotada en tamaño y en tiempo. Si no hay turno dentro
+    de `max_wait_s` (o la cola está llena) rechaza enseguida con `UpstreamBusy`
+    en lugar de dejar que los requests se acumulen.
+    """
+
+    def __init__(self, rate: float = OPENAQ_RATE_PER_S, burst: int = OPENAQ_BURST,
+                 max_queue: int = OPENAQ_QUEUE_SIZE, max_wait_s: float = OPENAQ_QUEUE_TIMEOUT_S):
+        self.enabled = rate > 0
+        self.bucket = TokenBucket(rate, burst) if self.enabled else None
+        self.max_queue = max_queue
+        self.max_wait_s = max_wait_s
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+
+    def backoff(self, seconds: float):
+        """Upstream respondió 429: no emitir más requests durante `seconds`."""
+        if self.enabled:
+            self.bucket._refill()
+            self.bucket.tokens = min(self.bucket.tokens, -seconds * self.bucket.rate)
+
+    async def acquire(self):
+        if not self.enabled:
+            return
+        wait = self.bucket.reserve()
+        if wait > 0:
+            if self.waiting >= self.max_queue or wait > self.max_wait_s:
+                self.bucket.cancel()
+                self.rejected += 1
+                raise UpstreamBusy(wait)
+            self.waiting += 1
+            try:
+                await asyncio.sleep(wait)
+            finally:
+                self.waiting -= 1
+        self.admitted += 1
+
+
+class InflightLimiter:
+    """Tope de requests en curso; el excedente se rechaza al instante (429)."""
+
+    def __init__(self, limit: int = API_MAX_INFLIGHT):
+        self.limit = limit
+        self.inflight = 0
+
+    def try_enter(self) -> bool:
+        if self.limit and self.inflight >= self.limit:
+            return False
+        self.inflight += 1
+        return True
+
+    def exit(self):
+        self.inflight -= 1
@@ -0,0 +1,151 @@
+# app/aqi_engine.py
+import numpy as np
+import pandas as pd
+
+from app.core import AQI_BREAKPOINTS, AQI_CATEGORY_LABELS, aqi_category_codes, round_array
+
+# Parámetros secundarios que, sin otra medición, dan el AQI "leve" de fallback
+SECONDARY_PREFIXES = ("no", "so2", "nh3")
+
+
+class BreakpointTable:
+    """Tabla de breakpoints de un contaminante precompilada a arrays numpy."""
+
+    def __init__(self, breakpoints):
+        self.C_low = np.array([bp["C_low"] for bp in breakpoints], dtype=np.float64)
+        self.C_high = np.array([bp["C_high"] for bp in breakpoints], dtype=np.float64)
+        self.I_low = np.array([bp["I_low"] for bp in breakpoints], dtype=np.float64)
+        self.I_high = np.array([bp["I_high"] for bp in breakpoints], dtype=np.float64)
+
+    def aqi(self, concentration):
+        """
+        Equivalente vectorizado de `calculate_aqi`: NaN donde la concentración
+        cae fuera de todos los tramos (o entre dos tramos).
+        """
+        c = np.asarray(concentration, dtype=np.float64)
+        # Último tramo con C_low <= c (los tramos están ordenados y no se solapan)
+        i = np.searchsorted(self.C_low, c, side="right") - 1
+        j = np.clip(i, 0, len(self.C_low) - 1)
+        C_low, C_high = self.C_low[j], self.C_high[j]
+        I_low, I_high = self.I_low[j], self.I_high[j]
+        valid = (i >= 0) & (c <= C_high)
+
+        with np.errstate(invalid="ignore"):
+            aqi = round_array(((I_high - I_low) / (C_high - C_low)) * (c - C_low) + I_low, 1)
+        aqi[~valid] = np.nan
+        return aqi
+
+
+BREAKPOINT_TABLES = {param: BreakpointTable(bps) for param, bps in AQI_BREAKPOINTS.items()}
+
+
+def calculate_aqi_array(param: str, concentration):
+    """AQI de superficie para un array de concentraciones de un mismo contaminante."""
+    return BREAKPOINT_TABLES[param].aqi(concentration)
+
+
+def normalize_parameter(name: str) -> str:
+    """Misma normalización que `compute_aqi_summary` ("PM2.5" → "pm25", "NO₂" → "no2")."""
+    return name.lower().replace("₂", "2").replace(".", "")
+
+
+def measurements_from_stations(stations):
+    """Aplana `latest_measurements` de varias estaciones a columnas (station_id, parameter, value)."""
+    station_ids, parameters, values = [], [], []
+    for station in stations:
+        for m in station.get("latest_measurements", []):
+            station_ids.append(station["id"])
+            parameters.append(m["parameter"])
+            values.append(np.nan if m["value"] is None else m["value"])
+    return (
+        np.array(station_ids, dtype=object),
+        np.array(parameters, dtype=object),
+        np.array(values, dtype=np.float64),
+    )
+
+
+def compute_aqi_summary_batch(station_ids, parameters, values, index=None):
+    """
+    Equivalente vectorizado de `compute_aqi_summary` para muchas estaciones a la vez.
+    Recibe columnas paralelas (una fila por medición) y devuelve un DataFrame
+    indexado por estación con `aqi_value`, `category` y `dominant_pollutant`,
+    con los mismos resultados que la versión escalar. `index` permite incluir
+    estaciones sin mediciones (quedan como "Sin datos").
+    """
+    station_ids = np.asarray(station_ids, dtype=object)
+    parameters = np.asarray(parameters, dtype=object)
+    values = np.asarray(values, dtype=np.float64)
+    n = len(values)
+
+    station_pos, stations = pd.factorize(station_ids, sort=False)
+    n_stations = len(stations)
+
+    # Normalización de nombres solo sobre los valores únicos
+    name_pos, raw_names = pd.factorize(parameters, sort=False)
+    norm_names = np.array([normalize_parameter(p) for p in raw_names], dtype=object)
+    norm = norm_names[name_pos] if n else np.array([], dtype=object)
+
+    # --- Sub-índices por medición ---
+    aqi = np.full(n, np.nan)
+    for param, table in BREAKPOINT_TABLES.items():
+        mask = norm == param
+        if not mask.any():
+            continue
+        sub = table.aqi(values[mask])
+        # por debajo del rango mínimo → AQI = 0 (aire excelente)
+        sub[np.isnan(sub) & (values[mask] < table.C_low[0])] = 0
+        aqi[mask] = sub
+
+    # --- Contaminante dominante: primer máximo por estación (como `max` escalar) ---
+    aqi_value = np.full(n_stations, np.nan)
+    dominant = np.full(n_stations, None, dtype=object)
+    valid = ~np.isnan(aqi)
+    if valid.any():
+        rows = np.flatnonzero(valid)
+        order = np.lexsort((rows, -aqi[rows], station_pos[rows]))
+        rows = rows[order]
+        first = np.r_[True, station_pos[rows][1:] != station_pos[rows][:-1]]
+        best = rows[first]
+        aqi_value[station_pos[best]] = aqi[best]
+        dominant[station_pos[best]] = np.char.upper(norm[best].astype(str)).astype(object)
+
+    codes = aqi_category_codes(aqi_value)
+    category = AQI_CATEGORY_LABELS[codes].astype(object)
+
+    # --- Fallback: estaciones sin AQI pero con gases reactivos secundarios ---
+    no_aqi = np.isnan(aqi_value)
+    if no_aqi.any() and n:
+        lower_names = np.array([p.lower() for p in raw_names], dtype=object)
+        is_secondary = np.array([p.startswith(SECONDARY_PREFIXES) for p in lower_names], dtype=bool)[name_pos]
+        rows = np.flatnonzero(is_secondary & no_aqi[station_pos])
+        if len(rows):
+            # primera medición secundaria (en orden original) por estación
+            st, first_idx = np.unique(station_pos[rows], return_index=True)
+            first_rows = rows[first_idx]
+            aqi_value[st] = 20
+            category[st] = "Buena"
+            dominant[st] = [p.upper() for p in parameters[first_rows]]
+
+    summary = pd.DataFrame(
+        {"aqi_value": aqi_value, "category": category, "dominant_pollutant": dominant},
+        index=pd.Index(stations, name="station_id"),
+    )
+    if index is not None:
+        summary = summary.reindex(pd.Index(index, name="station_id"))
+        summary["category"] = summary["category"].fillna("Sin datos")
+        summary["dominant_pollutant"] = summary["dominant_pollutant"].astype(object).where(
+            summary["dominant_pollutant"].notna(), None
+        )
+    return summary
+
+
+def summary_records(summary: pd.DataFrame):
+    """Filas de `compute_aqi_summary_batch` con el formato de `compute_aqi_summary` (NaN → None)."""
+    return [
+        {
+            "aqi_value": None if np.isnan(v) else float(v),
+            "category": c,
+            "dominant_pollutant": d,
+        }
+        for v, c, d in zip(summary["aqi_value"].to_numpy(), summary["category"], summary["dominant_pollutant"])
+    ]
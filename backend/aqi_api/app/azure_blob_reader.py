@@ -1,12 +1,107 @@
+import json
 import os
-import io
+import tempfile
 import pandas as pd
-from azure.storage.blob import BlobServiceClient
+import pyarrow as pa
+import pyarrow.parquet as pq
 
-def load_latest_parquet_from_blob(container_name: str = "tempo-data") -> pd.DataFrame:
+# Columnas que sirve la API (el resto del parquet no se lee)
+TEMPO_COLUMNS = ["lat", "lon", "no2", "o3tot", "o3prof", "hcho"]
+
+TEMPO_BLOB_PREFIX = os.getenv("TEMPO_BLOB_PREFIX", "tempo_full_")
+TEMPO_SPOOL_DIR = os.getenv("TEMPO_SPOOL_DIR", tempfile.gettempdir())
+BLOB_DOWNLOAD_CONCURRENCY = int(os.getenv("BLOB_DOWNLOAD_CONCURRENCY", "8"))
+BLOB_CHUNK_SIZE = int(os.getenv("BLOB_CHUNK_SIZE_MB", "8")) * 1024 * 1024
+# Copia local del último snapshot descargado (sobrevive reinicios si el directorio persiste)
+TEMPO_LOCAL_DIR = os.getenv("TEMPO_LOCAL_DIR", os.path.join(TEMPO_SPOOL_DIR, "tempo_local"))
+LOCAL_PARQUET = "latest.parquet"
+LOCAL_META = "latest.json"
+
+
+# Mantener en sincronía con `parse_bbox` de tempo_api/tempo_core/tempo_file_parser.py:
+# TEMPO_BBOX y TEMPO_PARSE_BBOX usan el mismo formato, pero los dos servicios
+# se construyen por separado y no comparten código.
+def parse_bbox(value: str):
+    """"minLon,minLat,maxLon,maxLat" → tupla de floats (o None si no está configurado)."""
+    if not value:
+        return None
+    min_lon, min_lat, max_lon, max_lat = (float(v) for v in value.split(","))
+    return min_lon, min_lat, max_lon, max_lat
+
+
+TEMPO_BBOX = parse_bbox(os.getenv("TEMPO_BBOX", ""))
+
+
+def read_tempo_parquet(path: str, columns=None, bbox=None) -> pd.DataFrame:
+    """
+    Lee un parquet TEMPO local proyectando solo `columns` (como float32) y,
+    si hay `bbox`, descartando row groups fuera de la caja por sus estadísticas.
+    """
+    columns = columns or TEMPO_COLUMNS
+    schema = pq.read_schema(path)
+    columns = [c for c in columns if c in schema.names]
+
+    filters = None
+    if bbox is not None:
+        min_lon, min_lat, max_lon, max_lat = bbox
+        filters = [
+            ("lon", ">=", min_lon), ("lon", "<=", max_lon),
+            ("lat", ">=", min_lat), ("lat", "<=", max_lat),
+        ]
+
+    table = pq.read_table(path, columns=columns, filters=filters, memory_map=True)
+    table = table.cast(pa.schema([(name, pa.float32()) for name in table.column_names]))
+    # self_destruct libera cada columna Arrow a medida que se convierte
+    return table.to_pandas(split_blocks=True, self_destruct=True)
+
+
+def read_local_meta():
+    """Metadatos (blob, etag, last_modified) de la copia local, o None si no hay."""
+    try:
+        with open(os.path.join(TEMPO_LOCAL_DIR, LOCAL_META)) as f:
+            meta = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+    return meta if os.path.exists(os.path.join(TEMPO_LOCAL_DIR, LOCAL_PARQUET)) else None
+
+
+def _write_local_meta(meta: dict):
+    fd, tmp = tempfile.mkstemp(prefix=".latest.", dir=TEMPO_LOCAL_DIR)
+    with os.fdopen(fd, "w") as f:
+        json.dump(meta, f)
+    os.replace(tmp, os.path.join(TEMPO_LOCAL_DIR, LOCAL_META))
+
+
+def _read_local(meta: dict, columns=None, bbox=None) -> pd.DataFrame:
+    df = read_tempo_parquet(os.path.join(TEMPO_LOCAL_DIR, LOCAL_PARQUET), columns=columns, bbox=bbox)
+    # Origen del snapshot (lo usan el histórico y la revalidación condicional)
+    df.attrs["source_blob"] = meta["blob"]
+    df.attrs["source_time"] = meta["last_modified"]
+    df.attrs["source_etag"] = meta["etag"]
+    return df
+
+
+def load_local_parquet(columns=None, bbox=TEMPO_BBOX):
+    """Último snapshot descargado, desde disco (sin red). None si no hay copia local."""
+    meta = read_local_meta()
+    if meta is None:
+        return None
+    df = _read_local(meta, columns=columns, bbox=bbox)
+    print(f"Copia local cargada: {meta['blob']} ({len(df):,} filas)")
+    return df
+
+
+def load_latest_parquet_from_blob(container_name: str = "tempo-data", columns=None, bbox=TEMPO_BBOX,
+                                  if_none_match: str = None):
     """
     Descarga el archivo Parquet más reciente desde un contenedor de Azure Blob Storage
     y lo carga en un DataFrame de pandas.
+
+    La descarga se hace en chunks por rangos en paralelo directo a disco (sin
+    copia completa en memoria), y del parquet solo se leen las columnas que
+    sirve la API. El archivo queda como copia local junto con su ETag: si el
+    blob más reciente no cambió no se vuelve a descargar, y si su ETag coincide
+    con `if_none_match` (el snapshot que ya está en memoria) devuelve None.
     """
 
     # Obtener cadena de conexión
@@ -14,12 +109,18 @@ def load_latest_parquet_from_blob(container_name: str = "tempo-data") -> pd.Data
     if not conn_str:
         raise EnvironmentError("Falta la variable AZURE_STORAGE_CONNECTION_STRING")
 
-    # Crear cliente
-    blob_service = BlobServiceClient.from_connection_string(conn_str)
+    # Crear cliente (el SDK de Azure se importa recién acá: no pesa en el arranque)
+    from azure.storage.blob import BlobServiceClient
+
+    blob_service = BlobServiceClient.from_connection_string(
+        conn_str,
+        max_single_get_size=BLOB_CHUNK_SIZE,
+        max_chunk_get_size=BLOB_CHUNK_SIZE,
+    )
     container_client = blob_service.get_container_client(container_name)
 
-    # Listar blobs
-    blobs = list(container_client.list_blobs())
+    # Listar blobs (solo los snapshots TEMPO); el listado ya trae ETag y fecha: es el chequeo barato
+    blobs = list(container_client.list_blobs(name_starts_with=TEMPO_BLOB_PREFIX or None))
     if not blobs:
         raise FileNotFoundError(f"No hay archivos en el contenedor '{container_name}'")
 
@@ -27,11 +128,37 @@ def load_latest_parquet_from_blob(container_name: str = "tempo-data") -> pd.Data
     latest_blob = max(blobs, key=lambda b: b.last_modified)
     print(f"Último archivo encontrado: {latest_blob.name} ({latest_blob.last_modified})")
 
-    # Descargar el blob a memoria
-    blob_data = container_client.download_blob(latest_blob.name).readall()
+    if if_none_match and latest_blob.etag == if_none_match:
+        print("Sin cambios desde el snapshot actual; no se descarga.")
+        return None
+
+    meta = read_local_meta()
+    if meta is not None and meta["blob"] == latest_blob.name and meta["etag"] == latest_blob.etag:
+        print("La copia local está vigente; no se descarga.")
+    else:
+        # Descargar el blob a un archivo temporal (rangos en paralelo) y reemplazar la copia local
+        os.makedirs(TEMPO_LOCAL_DIR, exist_ok=True)
+        fd, spool_path = tempfile.mkstemp(prefix="tempo_", suffix=".parquet", dir=TEMPO_LOCAL_DIR)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                container_client.download_blob(
+                    latest_blob.name, max_concurrency=BLOB_DOWNLOAD_CONCURRENCY
+                ).readinto(f)
+            os.replace(spool_path, os.path.join(TEMPO_LOCAL_DIR, LOCAL_PARQUET))
+        except Exception:
+            if os.path.exists(spool_path):
+                os.remove(spool_path)
+            raise
+        meta = {
+            "blob": latest_blob.name,
+            "etag": latest_blob.etag,
+            "last_modified": latest_blob.last_modified.isoformat(),
+            "size": latest_blob.size,
+        }
+        _write_local_meta(meta)
 
-    # Cargar DataFrame desde bytes
-    df = pd.read_parquet(io.BytesIO(blob_data))
+    # Cargar DataFrame desde el archivo (memory map + proyección de columnas)
+    df = _read_local(meta, columns=columns, bbox=bbox)
     print(f"DataFrame cargado correctamente con {len(df):,} filas")
 
     return df
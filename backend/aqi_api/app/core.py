@@ -1,11 +1,9 @@
-import requests
-from geopy.distance import geodesic
 import pandas as pd
 import numpy as np
 import os
-import io
-from azure.storage.blob import BlobServiceClient
 import math
+import httpx
+from scipy.spatial import cKDTree
 
 # --- AQI breakpoints ---
 AQI_BREAKPOINTS = {
@@ -43,6 +41,26 @@ AQI_BREAKPOINTS = {
     ]
 }
 
+# --- Categorías AQI (límite superior inclusivo de cada tramo) ---
+AQI_CATEGORY_BOUNDS = np.array([50, 100, 150, 200, 300], dtype=np.float64)
+AQI_CATEGORY_LABELS = np.array([
+    "Buena", "Moderada", "Dañina para grupos sensibles", "Dañina", "Muy dañina", "Peligrosa", "Sin datos"
+], dtype=object)
+
+# --- Normalización de columnas TEMPO ---
+TEMPO_SCALE_FACTORS = {
+    "no2": 1e16,     # molec/cm²
+    "o3tot": 300.0,  # DU
+    "hcho": 2e16     # molec/cm²
+}
+
+TEMPO_WEIGHTS = {"no2": 0.5, "o3tot": 0.4, "hcho": 0.1}
+
+# Columnas de AQI TEMPO precalculadas por píxel en cada snapshot
+TEMPO_AQI_COLUMNS = ["tempo_aqi_value", "tempo_aqi_category", "aqi_no2", "aqi_o3tot", "aqi_hcho"]
+
+EARTH_RADIUS_KM = 6371.0088
+
 
 def calculate_aqi(concentration, breakpoints):
     for bp in breakpoints:
@@ -53,29 +71,33 @@ def calculate_aqi(concentration, breakpoints):
     return None
 
 
-def get_nearest_station(lat, lon, api_key, radius_km=25):
-    headers = {"X-API-Key": api_key}
-    url = "https://api.openaq.org/v3/locations"
+async def get_nearest_station(lat, lon, client, radius_km=25):
     params = {"coordinates": f"{lat},{lon}", "radius": radius_km * 1000, "limit": 100}
 
-    r = requests.get(url, headers=headers, params=params)
+    r = await client.get("/locations", params=params)
     r.raise_for_status()
-    results = r.json().get("results", [])
+    results = [s for s in r.json().get("results", []) if s.get("coordinates")]
     if not results:
         return None
 
-    for s in results:
-        s["distance_km"] = geodesic((lat, lon), (s["coordinates"]["latitude"], s["coordinates"]["longitude"])).km
-
-    return min(results, key=lambda x: x["distance_km"])
+    # Distancias vectorizadas (haversine) en vez de un loop con geodesic
+    dist_km = haversine_km(
+        lat, lon,
+        [s["coordinates"]["latitude"] for s in results],
+        [s["coordinates"]["longitude"] for s in results],
+    )
+    nearest = int(np.argmin(dist_km))
+    results[nearest]["distance_km"] = float(dist_km[nearest])
+    return results[nearest]
 
 
-def attach_latest_measurements(station, api_key):
-    url = f"https://api.openaq.org/v3/locations/{station['id']}/latest"
-    headers = {"X-API-Key": api_key}
-    latest_data = requests.get(url, headers=headers).json()
+async def fetch_latest_values(station_id, client):
+    """Últimos valores por sensor de una estación: {sensorsId: {...}}."""
+    r = await client.get(f"/locations/{station_id}/latest")
+    r.raise_for_status()
+    latest_data = r.json()
 
-    sensor_values = {
+    return {
         item["sensorsId"]: {
             "value": item["value"],
             "datetime_utc": item["datetime"]["utc"],
@@ -84,6 +106,33 @@ def attach_latest_measurements(station, api_key):
         for item in latest_data.get("results", [])
     }
 
+
+async def attach_latest_measurements(station, client, cache=None):
+    """
+    Agrega `latest_measurements` a una copia de la estación.
+    Con `cache` (SingleFlightCache por id de estación) las requests concurrentes
+    a la misma estación comparten una sola llamada upstream.
+    Si upstream responde con error, la estación queda sin mediciones y con
+    `latest_unavailable = True` (el llamador decide cuánto cachear ese resultado).
+    """
+    latest_unavailable = False
+    try:
+        if cache is not None:
+            sensor_values = await cache.get_or_load(
+                station["id"], lambda: fetch_latest_values(station["id"], client)
+            )
+        else:
+            sensor_values = await fetch_latest_values(station["id"], client)
+    except httpx.HTTPStatusError:
+        # Sin mediciones recientes (no se cachea el error)
+        sensor_values = {}
+        latest_unavailable = True
+
+    # Copia: la estación puede venir del registro compartido
+    station = {**station, "sensors": [dict(s) for s in station.get("sensors", [])]}
+    if latest_unavailable:
+        station["latest_unavailable"] = True
+
     for sensor in station.get("sensors", []):
         sid = sensor["id"]
         sensor["latest"] = sensor_values.get(sid)
@@ -154,25 +203,47 @@ def compute_aqi_summary(station):
         "dominant_pollutant": dominant["parameter"].upper()
     }
 
-def get_nearest_tempo_point(df: pd.DataFrame, lat: float, lon: float):
+def get_nearest_tempo_point(snapshot, lat: float, lon: float):
     """
-    Dado un DataFrame de TEMPO (lat, lon, columnas de contaminantes)
+    Dado un snapshot de TEMPO (DataFrame + índice espacial)
     encuentra la fila más cercana al punto (lat, lon).
+    No modifica el DataFrame cacheado: la búsqueda usa el
+    índice de grilla (TempoIndex, CSR por celdas) del snapshot.
     """
-    if df.empty:
+    if len(snapshot) == 0:
         raise ValueError("El DataFrame TEMPO está vacío")
 
-    # Calcular distancia euclidiana aproximada (en grados)
-    df["dist"] = np.sqrt((df["lat"] - lat)**2 + (df["lon"] - lon)**2)
-    nearest_row = df.loc[df["dist"].idxmin()].to_dict()
+    # Distancia euclidiana aproximada (en grados), resuelta por el índice
+    dist, pos = snapshot.index.nearest(lat, lon)
+    nearest_row = snapshot.row(pos)
+    nearest_row["dist"] = dist
     return nearest_row
 
-def get_nearest_pixel(df, lat, lon):
-    lat_min, lat_max = lat - 0.1, lat + 0.1
-    lon_min, lon_max = lon - 0.1, lon + 0.1
-    subset = df.query("@lat_min < lat < @lat_max and @lon_min < lon < @lon_max")
-    if subset.empty: return None
-    return subset.iloc[((subset.lat - lat)**2 + (subset.lon - lon)**2).idxmin()]
+def get_tempo_cell(snapshot, lat: float, lon: float):
+    """
+    Lookup O(1) en la grilla regular del snapshot (si está habilitada):
+    devuelve los valores promedio de la celda con el mismo formato que
+    `get_nearest_tempo_point` (lat/lon = centro de celda), o None si no hay datos.
+    """
+    raster = snapshot.raster
+    if raster is None:
+        return None
+    ij = raster.cell(lat, lon)
+    if ij is None:
+        return None
+    values = raster.point(lat, lon)
+    if all(math.isnan(values.get(p, math.nan)) for p in ("no2", "o3tot", "o3prof", "hcho")):
+        return None
+
+    c_lat, c_lon = raster.cell_center(*ij)
+    row = {p: values.get(p) for p in ("no2", "o3tot", "o3prof", "hcho")}
+    row.update({"lat": c_lat, "lon": c_lon, "dist": math.hypot(c_lat - lat, c_lon - lon)})
+    return row
+
+def get_nearest_pixel(snapshot, lat, lon, max_dist=0.1):
+    dist, pos = snapshot.index.nearest(lat, lon, max_dist=max_dist)
+    if pos is None: return None
+    return snapshot.row(pos)
 
 
 def sanitize_json(obj):
@@ -191,20 +262,16 @@ def sanitize_json(obj):
 def compute_tempo_aqi(tempo_data):
     """
     Calcula un índice AQI extendido a partir de datos satelitales TEMPO (NO2, O3, HCHO).
+    Si `tempo_data` ya trae el AQI precalculado del snapshot, solo lo empaqueta.
     """
-    SCALE_FACTORS = {
-        "no2": 1e16,     # molec/cm²
-        "o3tot": 300.0,  # DU
-        "hcho": 2e16     # molec/cm²
-    }
-
-    WEIGHTS = {"no2": 0.5, "o3tot": 0.4, "hcho": 0.1}
+    if "tempo_aqi_value" in tempo_data:
+        return tempo_aqi_from_row(tempo_data)
 
     aqi_components = {}
     weighted_sum = 0.0
     total_weight = 0.0
 
-    for gas, factor in SCALE_FACTORS.items():
+    for gas, factor in TEMPO_SCALE_FACTORS.items():
         val = tempo_data.get(gas)
         if val is None or (isinstance(val, float) and math.isnan(val)):
             aqi_components[gas.upper()] = None
@@ -215,8 +282,8 @@ def compute_tempo_aqi(tempo_data):
         sub_index = round(rel * 100, 1)
         aqi_components[gas.upper()] = sub_index
 
-        weighted_sum += sub_index * WEIGHTS.get(gas, 1.0)
-        total_weight += WEIGHTS.get(gas, 1.0)
+        weighted_sum += sub_index * TEMPO_WEIGHTS.get(gas, 1.0)
+        total_weight += TEMPO_WEIGHTS.get(gas, 1.0)
 
     # Si no hay datos válidos
     if total_weight == 0:
@@ -248,6 +315,18 @@ def compute_tempo_aqi(tempo_data):
         "components": aqi_components
     }
 
+def tempo_aqi_from_row(row):
+    """Arma la salida de `compute_tempo_aqi` a partir de columnas precalculadas."""
+    def _clean(v):
+        return None if v is None or (isinstance(v, float) and math.isnan(v)) else v
+
+    value = _clean(row.get("tempo_aqi_value"))
+    return {
+        "tempo_aqi_value": value,
+        "tempo_aqi_category": row.get("tempo_aqi_category") if value is not None else "Sin datos",
+        "components": {gas.upper(): _clean(row.get(f"aqi_{gas}")) for gas in TEMPO_SCALE_FACTORS},
+    }
+
 def combine_aqi_sources(station, tempo_data=None):
     """
     Combina el AQI de superficie (OpenAQ) y el troposférico (TEMPO).
@@ -273,3 +352,153 @@ def combine_aqi_sources(station, tempo_data=None):
         combined["global_aqi"] = surface_aqi["aqi_value"] or tempo_aqi["tempo_aqi_value"]
 
     return combined
+
+
+# --- Versiones vectorizadas (batch) ---
+
+def round_array(values, ndigits=1):
+    """
+    `round()` de Python aplicado a un array. np.round difiere solo en los casos
+    límite (…5 exacto en decimal), que se resuelven con `round` escalar.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    out = np.round(values, ndigits)
+    scaled = values * 10 ** ndigits
+    ambiguous = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    if ambiguous.any():
+        out[ambiguous] = [round(float(v), ndigits) for v in values[ambiguous]]
+    return out
+
+def aqi_category_array(values):
+    """
+    Categoría EPA-like para un array de valores AQI (NaN → "Sin datos").
+    Mismos cortes que `compute_aqi_summary` y `compute_tempo_aqi`.
+    """
+    return AQI_CATEGORY_LABELS[aqi_category_codes(values)]
+
+
+def aqi_category_codes(values):
+    """Índices en `AQI_CATEGORY_LABELS` (int8) para un array de valores AQI."""
+    values = np.asarray(values, dtype=np.float64)
+    idx = np.searchsorted(AQI_CATEGORY_BOUNDS, values, side="left")
+    idx[np.isnan(values)] = len(AQI_CATEGORY_LABELS) - 1
+    return idx.astype(np.int8)
+
+
+def compute_tempo_aqi_arrays(columns):
+    """
+    Equivalente vectorizado de `compute_tempo_aqi` sobre columnas numpy
+    (`no2`, `o3tot`, `hcho`). Devuelve (valor, categoría, componentes),
+    con NaN donde no hay datos válidos.
+    """
+    n = len(next(iter(columns.values())))
+    weighted_sum = np.zeros(n, dtype=np.float64)
+    total_weight = np.zeros(n, dtype=np.float64)
+    components = {}
+
+    for gas, factor in TEMPO_SCALE_FACTORS.items():
+        val = columns.get(gas)
+        if val is None:
+            components[gas.upper()] = np.full(n, np.nan)
+            continue
+        val = np.asarray(val, dtype=np.float64)
+        valid = ~np.isnan(val)
+
+        # Clamp y normalización
+        sub_index = round_array(np.clip(val / factor, 0.0, 2.0) * 100, 1)
+        sub_index[~valid] = np.nan
+        components[gas.upper()] = sub_index
+
+        weight = TEMPO_WEIGHTS.get(gas, 1.0)
+        weighted_sum += np.where(valid, sub_index * weight, 0.0)
+        total_weight += np.where(valid, weight, 0.0)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        tempo_aqi_value = round_array(weighted_sum / total_weight, 1)
+    tempo_aqi_value[total_weight == 0] = np.nan
+
+    return tempo_aqi_value, aqi_category_array(tempo_aqi_value), components
+
+
+def add_tempo_aqi_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Precalcula el AQI TEMPO de todos los píxeles (una vez por snapshot):
+    `aqi_no2`, `aqi_o3tot`, `aqi_hcho`, `tempo_aqi_value` y `tempo_aqi_category`.
+    Modifica `df` in-place (el snapshot es dueño del DataFrame recién cargado).
+    """
+    columns = {gas: df[gas].to_numpy() for gas in TEMPO_SCALE_FACTORS if gas in df.columns}
+    if not columns:
+        columns = {"no2": np.full(len(df), np.nan)}
+    tempo_aqi_value, _, components = compute_tempo_aqi_arrays(columns)
+
+    for gas in TEMPO_SCALE_FACTORS:
+        df[f"aqi_{gas}"] = components[gas.upper()]
+    df["tempo_aqi_value"] = tempo_aqi_value
+    df["tempo_aqi_category"] = pd.Categorical.from_codes(
+        aqi_category_codes(tempo_aqi_value), categories=AQI_CATEGORY_LABELS
+    )
+    return df
+
+
+def combine_aqi_arrays(surface_aqi, tempo_aqi):
+    """
+    Equivalente vectorizado del cálculo de `global_aqi` en `combine_aqi_sources`
+    (0 y NaN cuentan como "sin dato", igual que en la versión escalar).
+    """
+    surface_aqi = np.asarray(surface_aqi, dtype=np.float64)
+    tempo_aqi = np.asarray(tempo_aqi, dtype=np.float64)
+    s_ok = ~np.isnan(surface_aqi) & (surface_aqi != 0)
+    t_ok = ~np.isnan(tempo_aqi) & (tempo_aqi != 0)
+    weighted = round_array(surface_aqi * 0.7 + tempo_aqi * 0.3, 1)
+    return np.where(s_ok & t_ok, weighted, np.where(s_ok, surface_aqi, tempo_aqi))
+
+
+def latlon_to_xyz(lat, lon):
+    """Proyecta lat/lon (grados) a la esfera unitaria, para KD-trees geodésicos."""
+    lat = np.radians(np.asarray(lat, dtype=np.float64))
+    lon = np.radians(np.asarray(lon, dtype=np.float64))
+    cos_lat = np.cos(lat)
+    return np.column_stack((cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)))
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Distancia haversine vectorizada en km."""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(a, dtype=np.float64)) for a in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def match_nearest_stations(lats, lons, st_lats, st_lons, radius_km=25, tree=None):
+    """
+    Para cada punto devuelve (índice de la estación más cercana, distancia km).
+    Los puntos sin estación dentro de `radius_km` quedan con índice -1 y distancia NaN.
+    `tree` permite reutilizar un KD-tree ya construido sobre `latlon_to_xyz(st_lats, st_lons)`.
+    """
+    n = len(lats)
+    if len(st_lats) == 0:
+        return np.full(n, -1, dtype=np.int64), np.full(n, np.nan)
+
+    if tree is None:
+        tree = cKDTree(latlon_to_xyz(st_lats, st_lons))
+    # Radio geodésico → distancia de cuerda en la esfera unitaria
+    chord = 2 * np.sin(radius_km / (2 * EARTH_RADIUS_KM))
+    _, idx = tree.query(latlon_to_xyz(lats, lons), k=1, distance_upper_bound=chord)
+    idx = np.where(idx >= len(st_lats), -1, idx)
+
+    st_lats = np.asarray(st_lats, dtype=np.float64)
+    st_lons = np.asarray(st_lons, dtype=np.float64)
+    found = idx >= 0
+    dist_km = np.full(n, np.nan)
+    dist_km[found] = haversine_km(
+        np.asarray(lats)[found], np.asarray(lons)[found], st_lats[idx[found]], st_lons[idx[found]]
+    )
+    return idx, dist_km
+
+
+async def get_stations_in_bbox(min_lat, min_lon, max_lat, max_lon, client, limit=1000):
+    """Lista las estaciones OpenAQ dentro de un bounding box (una sola llamada)."""
+    params = {"bbox": f"{min_lon},{min_lat},{max_lon},{max_lat}", "limit": limit}
+
+    r = await client.get("/locations", params=params)
+    r.raise_for_status()
+    return [s for s in r.json().get("results", []) if s.get("coordinates")]
@@ -0,0 +1,231 @@
+# app/history_store.py
+import json
+import math
+import os
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from app.core import aqi_category_array
+
+try:  # lock de escritura entre procesos (Linux/macOS)
+    import fcntl
+except ImportError:
+    fcntl = None
+
+TEMPO_HISTORY_DIR = os.getenv("TEMPO_HISTORY_DIR", os.path.join(tempfile.gettempdir(), "tempo_history"))
+# Snapshots que se conservan (84 ≈ una semana con el refresh de 2 h)
+TEMPO_HISTORY_KEEP = int(os.getenv("TEMPO_HISTORY_KEEP", "84"))
+# Lado (grados) de los tiles espaciales de cada partición
+TEMPO_HISTORY_TILE_DEG = float(os.getenv("TEMPO_HISTORY_TILE_DEG", "2.0"))
+
+HISTORY_COLUMNS = ("lat", "lon", "no2", "o3tot", "o3prof", "hcho", "tempo_aqi_value")
+INDEX_FILE = "index.json"
+LOCK_FILE = "write.lock"
+
+
+def to_utc(value: datetime) -> datetime:
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value.astimezone(timezone.utc)
+
+
+class TempoHistoryStore:
+    """
+    Histórico de snapshots TEMPO particionado por tiempo y por tile espacial.
+
+    Layout:
+        <dir>/index.json                          lista de snapshots (tiempo, origen, tiles)
+        <dir>/<YYYYmmddTHHMMSS>/t_<i>_<j>.parquet  píxeles de un tile de `tile_deg` grados
+
+    Una consulta por punto lee el índice y, por cada snapshot del rango, solo
+    los tiles que tocan la vecindad del punto (nunca el snapshot completo).
+    Las escrituras se serializan entre procesos con un `flock` sobre
+    `write.lock`: si varios workers agregan el mismo snapshot, solo uno lo escribe.
+    """
+
+    def __init__(self, directory: str = TEMPO_HISTORY_DIR, keep: int = TEMPO_HISTORY_KEEP,
+                 tile_deg: float = TEMPO_HISTORY_TILE_DEG):
+        self.directory = directory
+        self.keep = max(keep, 1)
+        self.tile_deg = tile_deg
+        self._write_lock = threading.Lock()
+        self._index = None
+        self._index_mtime = None
+
+    # --- índice ---
+    def index(self) -> dict:
+        """Índice actual (cacheado; se relee si otro proceso lo reemplazó)."""
+        path = os.path.join(self.directory, INDEX_FILE)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return {"tile_deg": self.tile_deg, "snapshots": []}
+        if mtime != self._index_mtime:
+            with open(path) as f:
+                self._index = json.load(f)
+            self._index_mtime = mtime
+        return self._index
+
+    def _write_index(self, index: dict):
+        fd, tmp = tempfile.mkstemp(prefix=".index.", dir=self.directory)
+        with os.fdopen(fd, "w") as f:
+            json.dump(index, f)
+        os.replace(tmp, os.path.join(self.directory, INDEX_FILE))
+
+    # --- escritura ---
+    @contextmanager
+    def _locked(self):
+        """Lock exclusivo (bloqueante) de escritura entre procesos del host."""
+        if fcntl is None:
+            yield
+            return
+        fd = os.open(os.path.join(self.directory, LOCK_FILE), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)
+
+    def tile_of(self, lat, lon):
+        i = np.floor(np.asarray(lat, dtype=np.float64) / self.tile_deg).astype(np.int64)
+        j = np.floor(np.asarray(lon, dtype=np.float64) / self.tile_deg).astype(np.int64)
+        return i, j
+
+    def append(self, snapshot) -> bool:
+        """
+        Agrega un snapshot al histórico (particionado por tile) y aplica la retención.
+        Devuelve False si ese snapshot ya estaba registrado.
+        """
+        when = snapshot.source.get("source_time")
+        when = to_utc(datetime.fromisoformat(when) if when else snapshot.loaded_at)
+        snap_id = when.strftime("%Y%m%dT%H%M%S")
+
+        # El directorio se crea recién en la primera escritura
+        os.makedirs(self.directory, exist_ok=True)
+        with self._write_lock, self._locked():
+            index = self.index()
+            if any(s["id"] == snap_id for s in index["snapshots"]):
+                return False
+
+            cols = snapshot.columns
+            names = [c for c in HISTORY_COLUMNS if c in cols]
+            lat = np.asarray(cols["lat"], dtype=np.float64)
+            lon = np.asarray(cols["lon"], dtype=np.float64)
+            # Filas sin lat/lon válida no tienen tile (NaN -> int64 daría una clave basura)
+            valid = np.flatnonzero(np.isfinite(lat) & np.isfinite(lon))
+            ti, tj = self.tile_of(lat[valid], lon[valid])
+            # Un solo sort por tile; cada partición es un slice contiguo
+            key = ti * 100_000 + tj
+            sort = np.argsort(key, kind="stable")
+            order = valid[sort]
+            sorted_key = key[sort]
+            starts = np.flatnonzero(np.r_[True, sorted_key[1:] != sorted_key[:-1]])
+            ends = np.r_[starts[1:], len(sorted_key)]
+
+            tmp_dir = tempfile.mkdtemp(prefix=f".{snap_id}.", dir=self.directory)
+            tiles = []
+            try:
+                for start, end in zip(starts, ends):
+                    rows = order[start:end]
+                    i, j = int(ti[sort[start]]), int(tj[sort[start]])
+                    table = pa.table({c: np.asarray(cols[c])[rows].astype(np.float32) for c in names})
+                    pq.write_table(table, os.path.join(tmp_dir, f"t_{i}_{j}.parquet"))
+                    tiles.append(f"{i}_{j}")
+                final_dir = os.path.join(self.directory, snap_id)
+                shutil.rmtree(final_dir, ignore_errors=True)
+                os.rename(tmp_dir, final_dir)
+            except Exception:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+                raise
+
+            snapshots = sorted(
+                index["snapshots"] + [{
+                    "id": snap_id,
+                    "time": when.isoformat(),
+                    "source": snapshot.source.get("source_blob"),
+                    "rows": int(len(valid)),
+                    "tiles": tiles,
+                }],
+                key=lambda s: s["time"],
+            )
+            expired, snapshots = snapshots[:-self.keep], snapshots[-self.keep:]
+            self._write_index({"tile_deg": self.tile_deg, "snapshots": snapshots})
+            for old in expired:
+                shutil.rmtree(os.path.join(self.directory, old["id"]), ignore_errors=True)
+        return True
+
+    def on_snapshot_swap(self, snapshot, is_writer=lambda: True):
+        """Listener de TempoCache: escribe el snapshot en segundo plano (no demora el swap)."""
+        if not is_writer():
+            return
+
+        def run():
+            try:
+                if self.append(snapshot):
+                    print(f"[HISTORY] Snapshot v{snapshot.version} agregado al histórico.")
+            except Exception as e:
+                print(f"[HISTORY][WARN] No se pudo guardar el snapshot en el histórico: {e}")
+
+        threading.Thread(target=run, daemon=True).start()
+
+    # --- consulta ---
+    def series(self, lat: float, lon: float, start: datetime = None, end: datetime = None,
+               max_dist: float = 0.1) -> list:
+        """
+        Serie temporal del píxel más cercano a (lat, lon) en cada snapshot del rango.
+        Lee solo los tiles que intersectan la caja de `max_dist` grados alrededor del punto.
+        """
+        index = self.index()
+        tile_deg = index.get("tile_deg", self.tile_deg)
+        start = to_utc(start) if start else None
+        end = to_utc(end) if end else None
+
+        i0, i1 = math.floor((lat - max_dist) / tile_deg), math.floor((lat + max_dist) / tile_deg)
+        j0, j1 = math.floor((lon - max_dist) / tile_deg), math.floor((lon + max_dist) / tile_deg)
+        wanted = [f"{i}_{j}" for i in range(i0, i1 + 1) for j in range(j0, j1 + 1)]
+
+        points = []
+        for snap in index["snapshots"]:
+            when = datetime.fromisoformat(snap["time"])
+            if (start and when < start) or (end and when > end):
+                continue
+            tiles = set(snap["tiles"])
+            parts = []
+            for tile in wanted:
+                if tile not in tiles:
+                    continue
+                try:
+                    parts.append(pq.read_table(os.path.join(self.directory, snap["id"], f"t_{tile}.parquet")))
+                except FileNotFoundError:
+                    # Expirado entre la lectura del índice y la del tile
+                    continue
+            if not parts:
+                continue
+            table = pa.concat_tables(parts)
+            plat = table.column("lat").to_numpy()
+            plon = table.column("lon").to_numpy()
+            d2 = (plat - lat) ** 2 + (plon - lon) ** 2
+            k = int(np.argmin(d2))
+            if d2[k] > max_dist ** 2:
+                continue
+
+            point = {"time": snap["time"], "nearest_lat": float(plat[k]), "nearest_lon": float(plon[k]),
+                     "distance_deg": float(np.sqrt(d2[k]))}
+            for name in table.column_names:
+                if name not in ("lat", "lon"):
+                    point[name] = float(table.column(name)[k].as_py())
+            value = point.get("tempo_aqi_value", np.nan)
+            if "tempo_aqi_value" in point:
+                # Se guarda como float32; se devuelve con el mismo redondeo que /aqi
+                point["tempo_aqi_value"] = round(value, 1)
+            point["tempo_aqi_category"] = str(aqi_category_array([value])[0])
+            points.append(point)
+        return points
+
+
+# instancia global
+history_store = TempoHistoryStore()
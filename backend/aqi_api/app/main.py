@@ -1,9 +1,15 @@
 # backend/aqi_api/app/main.py
 
 from contextlib import asynccontextmanager
+import asyncio
 import os
-from fastapi import FastAPI, Query, HTTPException, Depends
+from datetime import datetime
+from typing import List
+import numpy as np
+from fastapi import FastAPI, Query, HTTPException, Depends, Header, Response
+from pydantic import BaseModel, Field, confloat, model_validator
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from starlette.middleware.sessions import SessionMiddleware
 
 from dotenv import load_dotenv
@@ -11,14 +17,26 @@ from dotenv import load_dotenv
 from app.core import (
     get_nearest_station,
     attach_latest_measurements,
-    compute_aqi_summary,
     get_nearest_tempo_point,
-    get_nearest_pixel,   # si no lo usás, podés quitarlo
-    sanitize_json,
+    get_tempo_cell,
+    TEMPO_AQI_COLUMNS,
     combine_aqi_sources,
+    combine_aqi_arrays,
+    match_nearest_stations,
+    get_stations_in_bbox,
 )
-from app.tempo_cache import tempo_cache
-from app.routers import auth
+from app.aqi_engine import compute_aqi_summary_batch, measurements_from_stations, summary_records
+from app.tempo_cache import tempo_cache, SnapshotNotReady
+from app.response_cache import aqi_response_cache, AQI_CACHE_NEGATIVE_TTL_S
+from app.history_store import history_store, to_utc
+from app import metrics
+from app import serialization
+from app.serialization import FastJSONResponse
+from app.openaq_client import OpenAQClient, OPENAQ_LATEST_TTL_S, OPENAQ_LATEST_CACHE_SIZE
+from app.admission import AdmissionController, InflightLimiter, UpstreamBusy
+from app.ttl_cache import SingleFlightCache, MISSING
+from app.station_registry import station_registry
+from app.routers import auth, tiles
 # from app.deps import require_auth   # si querés proteger /aqi
 
 load_dotenv()
@@ -26,6 +44,17 @@ load_dotenv()
 API_KEY = os.getenv("API_KEY")
 FRONTEND_ORIGIN = os.getenv("FRONTEND_ORIGIN", "http://localhost:5173")
 SESSION_SECRET  = os.getenv("SESSION_SECRET", "devsessionsecret")
+# "nearest" (píxel más cercano, índice de grilla CSR TempoIndex) o "raster" (celda de la grilla regular, O(1);
+# requiere TEMPO_RASTER_RES_DEG > 0, si no usa "nearest")
+TEMPO_POINT_LOOKUP = os.getenv("TEMPO_POINT_LOOKUP", "nearest")
+
+# Cliente OpenAQ compartido (pool de conexiones keep-alive + control de admisión)
+openaq_admission = AdmissionController()
+openaq_client = OpenAQClient(API_KEY, admission=openaq_admission)
+# Tope de requests en curso en /aqi y /aqi/batch (el excedente recibe 429)
+api_inflight = InflightLimiter()
+# Últimas mediciones por id de estación (TTL + LRU + coalescing)
+latest_cache = SingleFlightCache(maxsize=OPENAQ_LATEST_CACHE_SIZE, ttl=OPENAQ_LATEST_TTL_S)
 
 
 @asynccontextmanager
@@ -37,17 +66,20 @@ async def lifespan(app: FastAPI):
             "Verifica backend/aqi_api/.env y que esté montado en docker-compose.yml (env_file)."
         )
 
-    print("[STARTUP] Cargando cache inicial TEMPO...")
-    try:
-        tempo_cache.get_df()  # fuerza carga inicial
-        print("[STARTUP] Cache inicial lista.")
-    except Exception as e:
-        print(f"[STARTUP][WARN] No se pudo cargar TEMPO al inicio: {e}")
+    # Registro de estaciones OpenAQ: se carga y refresca en segundo plano
+    registry_task = asyncio.create_task(station_registry.run(openaq_client))
+
+    # Warm-up TEMPO en segundo plano: la API acepta requests de inmediato y
+    # /readyz pasa a 200 cuando el primer snapshot está publicado
+    print("[STARTUP] Warm-up TEMPO en segundo plano...")
+    tempo_cache.start()
     yield
     print("[SHUTDOWN] Cerrando API Air Quality...")
+    registry_task.cancel()
+    await openaq_client.close()
 
 
-app = FastAPI(title="Air Quality API", version="1.1", lifespan=lifespan)
+app = FastAPI(title="Air Quality API", version="1.1", lifespan=lifespan, default_response_class=FastJSONResponse)
 
 # 1) SessionMiddleware (Authlib necesita request.session)
 app.add_middleware(
@@ -69,59 +101,450 @@ app.add_middleware(
 # 3) Rutas de autenticación
 app.include_router(auth.router)
 
+# 4) Tiles del overlay TEMPO
+app.include_router(tiles.router)
+
+# Caches derivados del snapshot TEMPO: se invalidan al publicar uno nuevo
+tempo_cache.on_swap(aqi_response_cache.on_snapshot_swap)
+tempo_cache.on_swap(lambda snapshot: tiles.tile_cache.clear())
+# Histórico: escribe el refresher del host; sin store compartido escriben todos los
+# workers y el flock del histórico deja una sola copia de cada snapshot
+tempo_cache.on_swap(lambda snapshot: history_store.on_snapshot_swap(
+    snapshot, is_writer=lambda: tempo_cache.shared is None or tempo_cache.shared.is_refresher
+))
+
+metrics.track_cache("openaq_latest", latest_cache)
+metrics.track_cache("aqi_response", aqi_response_cache)
+metrics.track_cache("tiles", tiles.tile_cache)
+metrics.ADMISSION_WAITING.set_function(lambda: openaq_admission.waiting)
+metrics.API_INFLIGHT.set_function(lambda: api_inflight.inflight)
+
+
+async def admit_request():
+    """Dependencia: rechaza al instante (429) si ya hay demasiados requests en curso."""
+    if not api_inflight.try_enter():
+        metrics.REQUESTS_SHED.labels("aqi", "inflight").inc()
+        raise HTTPException(status_code=429, detail="Demasiados requests en curso", headers={"Retry-After": "1"})
+    try:
+        yield
+    finally:
+        api_inflight.exit()
+
+
+def _current_snapshot():
+    """Snapshot TEMPO actual, o 503 (con Retry-After durante el warm-up)."""
+    try:
+        snapshot = tempo_cache.get_snapshot()
+    except SnapshotNotReady as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    if snapshot is None or len(snapshot) == 0:
+        raise HTTPException(status_code=503, detail="TEMPO no disponible (Azure/Blob)")
+    return snapshot
+
+
+def _lookup_tempo(lat: float, lon: float) -> dict:
+    """Lookup TEMPO (sync, corre en un hilo para no bloquear el event loop)."""
+    snapshot = _current_snapshot()
+
+    with metrics.stage("tempo_lookup"):
+        tempo_row = None
+        if TEMPO_POINT_LOOKUP == "raster":
+            tempo_row = get_tempo_cell(snapshot, lat, lon)
+        if tempo_row is None:
+            tempo_row = get_nearest_tempo_point(snapshot, lat, lon)
+
+    tempo_data = {
+        "nearest_lat": tempo_row["lat"],
+        "nearest_lon": tempo_row["lon"],
+        "distance_deg": tempo_row["dist"],
+        "no2":   tempo_row.get("no2"),
+        "o3tot": tempo_row.get("o3tot"),
+        "o3prof":tempo_row.get("o3prof"),
+        "hcho":  tempo_row.get("hcho"),
+    }
+    # AQI TEMPO precalculado al cargar el snapshot (solo en lookups por píxel)
+    if "tempo_aqi_value" in tempo_row:
+        tempo_data.update({k: tempo_row.get(k) for k in TEMPO_AQI_COLUMNS})
+    return tempo_data
+
+
+async def _lookup_station(lat: float, lon: float) -> dict:
+    # Búsqueda local en el registro; la llamada remota queda como fallback (registro
+    # sin cargar, o sin estación cercana: punto fuera de su bbox o registro truncado)
+    with metrics.stage("openaq_station"):
+        station = station_registry.nearest(lat, lon) if station_registry.ready else None
+        if station is None:
+            station = await get_nearest_station(lat, lon, openaq_client)
+    if not station:
+        raise HTTPException(status_code=404, detail="No se encontraron estaciones cercanas")
+    with metrics.stage("openaq_latest"):
+        return await attach_latest_measurements(station, openaq_client, cache=latest_cache)
+
 
-@app.get("/aqi")  # , dependencies=[Depends(require_auth)]  # descomenta si querés protegerlo
-def get_aqi(lat: float = Query(...), lon: float = Query(...)):
+@app.get("/aqi", dependencies=[Depends(admit_request)])  # , Depends(require_auth) si querés protegerlo
+async def get_aqi(lat: float = Query(...), lon: float = Query(...)):
     """
     Devuelve la estación más cercana de OpenAQ y los datos de TEMPO más cercanos.
+    Las llamadas a OpenAQ y el lookup TEMPO corren en paralelo. Las respuestas
+    se cachean por ubicación cuantizada (geohash) y versión del snapshot TEMPO.
+    Si OpenAQ está saturado, responde solo con TEMPO (`degraded: true`, no se cachea);
+    si falló el `/latest` de la estación, la respuesta se cachea solo por
+    `AQI_CACHE_NEGATIVE_TTL_S`.
     """
     try:
-        # --- 1. Buscar estación OpenAQ ---
-        station = get_nearest_station(lat, lon, API_KEY)
-        if not station:
-            raise HTTPException(status_code=404, detail="No se encontraron estaciones cercanas")
-
-        station = attach_latest_measurements(station, API_KEY)
-        aqi_summary = compute_aqi_summary(station)  # si no usás la var, podés quitarla
-
-        # --- 2. Cargar último archivo TEMPO (desde cache en memoria) ---
-        df_tempo = tempo_cache.get_df()
-        if df_tempo is None or len(df_tempo) == 0:
-            raise HTTPException(status_code=503, detail="TEMPO no disponible (Azure/Blob)")
-
-        tempo_row = get_nearest_tempo_point(df_tempo, lat, lon)
-
-        tempo_data = {
-            "nearest_lat": tempo_row["lat"],
-            "nearest_lon": tempo_row["lon"],
-            "distance_deg": tempo_row["dist"],
-            "no2":   tempo_row.get("no2"),
-            "o3tot": tempo_row.get("o3tot"),
-            "o3prof":tempo_row.get("o3prof"),
-            "hcho":  tempo_row.get("hcho"),
-        }
+        version = tempo_cache.version
+        key = aqi_response_cache.key(lat, lon, version)
+        body, _ = await aqi_response_cache.get_or_load(
+            key, lambda: _build_aqi_response(lat, lon),
+            ttl_of=lambda value: _aqi_response_ttl(value, version),
+        )
+        # El cache guarda el JSON ya serializado; solo se antepone `coordinates`
+        content = serialization.prepend_field(body, "coordinates", {"lat": lat, "lon": lon})
+        return Response(content=content, media_type=serialization.JSON_MEDIA_TYPE)
+    except HTTPException:
+        raise
+    except UpstreamBusy as e:
+        # Ni OpenAQ ni TEMPO disponibles: shedding rápido
+        metrics.REQUESTS_SHED.labels("aqi", "upstream").inc()
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": e.retry_after_header})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+def _aqi_response_ttl(value, version):
+    _, status = value
+    # Si hubo un swap durante el armado, la clave (versión vieja) ya quedó vacía
+    # por el `clear()` y la respuesta pudo salir del snapshot nuevo: no se guarda
+    if tempo_cache.version != version:
+        return 0
+    if status == "degraded":
+        return 0
+    if status == "latest_unavailable":
+        return AQI_CACHE_NEGATIVE_TTL_S
+    return MISSING
+
+
+async def _build_aqi_response(lat: float, lon: float):
+    """JSON de /aqi (sin `coordinates`) y su estado: "ok", "degraded" o "latest_unavailable"."""
+    # --- 1. Estación OpenAQ + 2. TEMPO (desde cache en memoria), concurrentes ---
+    station, tempo_data = await asyncio.gather(
+        _lookup_station(lat, lon),
+        asyncio.to_thread(_lookup_tempo, lat, lon),
+        return_exceptions=True,
+    )
+    if isinstance(tempo_data, BaseException):
+        raise station if isinstance(station, UpstreamBusy) else tempo_data
+    degraded = isinstance(station, UpstreamBusy)
+    if degraded:
+        # Presupuesto OpenAQ agotado: AQI solo con TEMPO
+        metrics.REQUESTS_SHED.labels("aqi", "degraded").inc()
+        station = {"latest_measurements": []}
+    elif isinstance(station, BaseException):
+        raise station
 
+    with metrics.stage("aqi_compute"):
         combined = combine_aqi_sources(station, tempo_data)
 
-        # --- 3. Respuesta ---
-        response = {
-            "coordinates": {"lat": lat, "lon": lon},
-            "station": {
-                "id": station["id"],
-                "name": station["name"],
-                "distance_km": station["distance_km"],
-            },
-            "aqi": combined,
-            "latest_measurements": station["latest_measurements"],
-            "tempo_data": tempo_data,
-        }
-        return sanitize_json(response)
+    # --- 3. Respuesta (sin `coordinates`, que se agregan por request) ---
+    response = {
+        "station": None if degraded else {
+            "id": station["id"],
+            "name": station["name"],
+            "distance_km": station["distance_km"],
+        },
+        "aqi": combined,
+        "latest_measurements": station["latest_measurements"],
+        "tempo_data": tempo_data,
+        "degraded": degraded,
+    }
+    if degraded:
+        status = "degraded"
+    elif station.get("latest_unavailable"):
+        status = "latest_unavailable"
+    else:
+        status = "ok"
+    with metrics.stage("serialization"):
+        return serialization.dumps(response), status
+
+
+MAX_BATCH_POINTS = int(os.getenv("MAX_BATCH_POINTS", "10000"))
+
+
+class BatchAQIRequest(BaseModel):
+    lat: List[confloat(ge=-90, le=90, allow_inf_nan=False)] = Field(..., min_length=1)
+    lon: List[confloat(ge=-180, le=180, allow_inf_nan=False)] = Field(..., min_length=1)
+    include_stations: bool = True
+    radius_km: float = Field(25, gt=0, le=100)
+
+    @model_validator(mode="after")
+    def check_lengths(self):
+        if len(self.lat) != len(self.lon):
+            raise ValueError("lat y lon deben tener la misma longitud")
+        if len(self.lat) > MAX_BATCH_POINTS:
+            raise ValueError(f"Máximo {MAX_BATCH_POINTS} puntos por request")
+        return self
+
+
+def _lookup_tempo_batch(lats: np.ndarray, lons: np.ndarray):
+    """TEMPO: píxel más cercano y AQI para todos los puntos (vectorizado)."""
+    snapshot = _current_snapshot()
+
+    dist, pos = snapshot.index.nearest_many(lats, lons)
+    cols = snapshot.columns
+    # Sin píxel (-1): no indexar con -1 (sería el último píxel), queda NaN / "Sin datos"
+    miss = pos < 0
+    safe = np.where(miss, 0, pos)
+
+    def gather(name):
+        values = np.asarray(cols[name][safe])
+        if miss.any():
+            values = values.astype(np.float64) if values.dtype.kind in "iu" else values
+            values[miss] = np.nan
+        return values
+
+    tempo = {
+        "nearest_lat": gather("lat"),
+        "nearest_lon": gather("lon"),
+        "distance_deg": dist,
+    }
+    for gas in ("no2", "o3tot", "o3prof", "hcho"):
+        tempo[gas] = gather(gas) if gas in cols else np.full(len(pos), np.nan)
+
+    # AQI TEMPO precalculado por píxel: solo un gather
+    tempo["tempo_aqi_value"] = gather("tempo_aqi_value")
+    category = np.asarray(cols["tempo_aqi_category"][safe])
+    tempo["tempo_aqi_category"] = np.where(miss, "Sin datos", category) if miss.any() else category
+    return snapshot.version, tempo
+
+
+async def _match_stations_remote(lats: np.ndarray, lons: np.ndarray, radius_km: float):
+    """Estaciones del bbox que cubre los puntos (una llamada a OpenAQ) + match vectorizado."""
+    pad_lat = radius_km / 111.0
+    pad_lon = pad_lat / max(np.cos(np.radians(np.abs(lats).max())), 0.01)
+    stations = await get_stations_in_bbox(
+        lats.min() - pad_lat, lons.min() - pad_lon,
+        lats.max() + pad_lat, lons.max() + pad_lon,
+        openaq_client,
+    )
+    st_lats = np.array([s["coordinates"]["latitude"] for s in stations], dtype=np.float64)
+    st_lons = np.array([s["coordinates"]["longitude"] for s in stations], dtype=np.float64)
+    idx, station_dist = match_nearest_stations(lats, lons, st_lats, st_lons, radius_km)
+    return stations, idx, station_dist
+
+
+async def _lookup_stations_batch(lats: np.ndarray, lons: np.ndarray, radius_km: float):
+    """OpenAQ: match vectorizado (registro local o bbox) + latest por estación única."""
+    station_idx = np.full(len(lats), -1, dtype=np.int64)
+    surface_value = np.full(len(lats), np.nan)
+    degraded = False
+
+    if station_registry.ready:
+        state = station_registry.state
+        stations = state.stations
+        idx, station_dist = station_registry.nearest_many(lats, lons, radius_km, state=state)
+        # Puntos sin estación en el registro (fuera de su bbox o registro truncado):
+        # una búsqueda remota solo sobre esos puntos
+        miss = np.flatnonzero(idx < 0)
+        if len(miss):
+            try:
+                extra, extra_idx, extra_dist = await _match_stations_remote(lats[miss], lons[miss], radius_km)
+            except UpstreamBusy:
+                extra, degraded = [], True
+            if extra:
+                idx[miss] = np.where(extra_idx >= 0, extra_idx + len(stations), -1)
+                station_dist[miss] = extra_dist
+                stations = stations + extra
+    else:
+        stations, idx, station_dist = await _match_stations_remote(lats, lons, radius_km)
+
+    # Mediciones y AQI de superficie una sola vez por estación única (en paralelo);
+    # las que no consiguen turno en OpenAQ quedan sin mediciones (AQI solo TEMPO)
+    matched = np.unique(idx[idx >= 0])
+    results = await asyncio.gather(
+        *(attach_latest_measurements(stations[st_i], openaq_client, cache=latest_cache) for st_i in matched),
+        return_exceptions=True,
+    )
+    matched_stations = []
+    for st_i, result in zip(matched, results):
+        if isinstance(result, UpstreamBusy):
+            degraded = True
+            result = {**stations[st_i], "latest_measurements": []}
+        elif isinstance(result, BaseException):
+            raise result
+        matched_stations.append(result)
+
+    remap = np.full(len(stations), -1, dtype=np.int64)
+    remap[matched] = np.arange(len(matched))
+
+    # AQI de superficie de todas las estaciones en una sola pasada vectorizada
+    summary = compute_aqi_summary_batch(
+        *measurements_from_stations(matched_stations),
+        index=[station["id"] for station in matched_stations],
+    )
+    station_aqi = summary["aqi_value"].to_numpy()
+    stations_out = [
+        {"id": station["id"], "name": station["name"], "surface_aqi": surface}
+        for station, surface in zip(matched_stations, summary_records(summary))
+    ]
+
+    found = idx >= 0
+    station_idx[found] = remap[idx[found]]
+    surface_value[found] = station_aqi[station_idx[found]]
+    return station_idx, station_dist, surface_value, stations_out, degraded
+
+
+BATCH_FORMATS = {
+    "json": serialization.JSON_MEDIA_TYPE,
+    "msgpack": serialization.MSGPACK_MEDIA_TYPE,
+    "arrow": serialization.ARROW_MEDIA_TYPE,
+}
+
+
+@app.post("/aqi/batch", dependencies=[Depends(admit_request)])
+async def get_aqi_batch(
+    req: BatchAQIRequest,
+    format: str = Query(None, pattern="^(json|msgpack|arrow)$"),
+    accept: str = Header(None),
+):
+    """
+    Versión batch de /aqi: resuelve píxel TEMPO, AQI TEMPO y estación OpenAQ
+    para muchos puntos con operaciones vectorizadas sobre el snapshot cacheado.
+    La respuesta es columnar (una lista por campo, alineada con los puntos).
+    Formato: JSON por defecto; MessagePack o Arrow IPC con `?format=` o el header Accept.
+    """
+    fmt = serialization.negotiate_format(accept, format)
+    if fmt == "msgpack" and serialization.msgpack is None:
+        raise HTTPException(status_code=406, detail="MessagePack no disponible (instalar `msgpack`)")
+    try:
+        lats = np.asarray(req.lat, dtype=np.float64)
+        lons = np.asarray(req.lon, dtype=np.float64)
+
+        tempo_job = asyncio.to_thread(_lookup_tempo_batch, lats, lons)
+        stations_result = None
+        if req.include_stations:
+            tempo_result, stations_result = await asyncio.gather(
+                tempo_job, _lookup_stations_batch(lats, lons, req.radius_km), return_exceptions=True
+            )
+            if isinstance(tempo_result, BaseException):
+                raise tempo_result
+            version, tempo = tempo_result
+            if isinstance(stations_result, UpstreamBusy):
+                stations_result = None
+            elif isinstance(stations_result, BaseException):
+                raise stations_result
+        else:
+            version, tempo = await tempo_job
+        if stations_result is not None:
+            station_idx, station_dist, surface_value, stations_out, degraded = stations_result
+        else:
+            # Sin estaciones (no pedidas, o OpenAQ saturado al buscarlas)
+            degraded = req.include_stations
+            station_idx = np.full(len(lats), -1, dtype=np.int64)
+            station_dist = np.full(len(lats), np.nan)
+            surface_value = np.full(len(lats), np.nan)
+            stations_out = []
+        if degraded:
+            metrics.REQUESTS_SHED.labels("aqi_batch", "degraded").inc()
+
+        global_aqi = combine_aqi_arrays(surface_value, tempo["tempo_aqi_value"])
+
+        with metrics.stage("serialization"):
+            if fmt == "arrow":
+                # Una fila por punto; estaciones y versión en los metadatos del schema
+                content = serialization.to_arrow_stream(
+                    {
+                        "lat": lats,
+                        "lon": lons,
+                        **tempo,
+                        "station_index": station_idx,
+                        "station_distance_km": station_dist,
+                        "global_aqi": global_aqi,
+                    },
+                    metadata={"snapshot_version": version, "stations": stations_out, "degraded": degraded},
+                )
+            else:
+                # --- Respuesta compacta (columnar), arrays numpy sin pasar por listas ---
+                response = {
+                    "count": int(len(lats)),
+                    "snapshot_version": version,
+                    "coordinates": {"lat": lats, "lon": lons},
+                    "tempo_data": tempo,
+                    "station_index": station_idx,
+                    "station_distance_km": station_dist,
+                    "stations": stations_out,
+                    "global_aqi": global_aqi,
+                    "degraded": degraded,
+                }
+                if fmt == "msgpack":
+                    content = serialization.to_msgpack(response)
+                else:
+                    content = serialization.dumps(response)
+        return Response(content=content, media_type=BATCH_FORMATS[fmt])
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/aqi/history")
+async def get_aqi_history(
+    lat: float = Query(...),
+    lon: float = Query(...),
+    start: datetime = Query(None, alias="from"),
+    end: datetime = Query(None, alias="to"),
+):
+    """
+    Serie temporal TEMPO del píxel más cercano a (lat, lon) entre `from` y `to`
+    (ISO 8601, UTC). Lee solo las particiones (snapshot × tile) del punto.
+    """
+    start = to_utc(start) if start else None
+    end = to_utc(end) if end else None
+    if start and end and start > end:
+        raise HTTPException(status_code=400, detail="`from` debe ser anterior a `to`")
+    try:
+        with metrics.stage("history_lookup"):
+            points = await asyncio.to_thread(history_store.series, lat, lon, start, end)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return {
+        "coordinates": {"lat": lat, "lon": lon},
+        "from": start,
+        "to": end,
+        "count": len(points),
+        "points": points,
+    }
+
+
+@app.get("/healthz")
+def healthz():
+    """Liveness: el proceso responde (no depende de TEMPO ni de OpenAQ)."""
+    return {"status": "ok"}
+
+
+@app.get("/readyz")
+def readyz():
+    """Readiness: 200 cuando hay un snapshot TEMPO cargado, 503 mientras tanto."""
+    body = {
+        "ready": tempo_cache.ready,
+        "tempo_version": tempo_cache.version,
+        "station_registry": station_registry.ready,
+        "last_error": tempo_cache.last_error,
+    }
+    return FastJSONResponse(body, status_code=200 if body["ready"] else 503)
+
+
+@app.get("/metrics")
+def get_metrics():
+    """Métricas en formato de texto Prometheus."""
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/tempo/status")
+def tempo_status():
+    """Versión, antigüedad y estado de refresh del snapshot TEMPO en memoria."""
+    return tempo_cache.status()
+
+
 # (opcional) Endpoint para verificar que el SessionMiddleware está activo
 from fastapi import Request
 @app.get("/debug/mw")
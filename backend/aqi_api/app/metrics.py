@@ -0,0 +1,240 @@
+# app/metrics.py
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Buckets (segundos) pensados para etapas de sub-ms a varios segundos
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    body = ",".join(f'{k}="{str(v)}"' for k, v in pairs)
+    return "{" + body + "}"
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        values = tuple(str(v) for v in values)
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _default(self):
+        return self.labels()
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        for values, child in sorted(self._children.items()):
+            lines.extend(self._render_child(values, child))
+        return lines
+
+
+class _CounterChild:
+    def __init__(self):
+        self.value = 0.0
+        self.function = None
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+    def set_function(self, function):
+        """Valor leído al momento del scrape (contadores que ya lleva otro objeto)."""
+        self.function = function
+
+    def get(self):
+        return self.function() if self.function is not None else self.value
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        self._default().inc(amount)
+
+    def _render_child(self, values, child):
+        return [f"{self.name}{_format_labels(self.labelnames, values)} {child.get()}"]
+
+
+class _GaugeChild:
+    def __init__(self):
+        self.value = 0.0
+        self.function = None
+
+    def set(self, value: float):
+        self.value = value
+
+    def set_function(self, function):
+        """Valor calculado al momento del scrape."""
+        self.function = function
+
+    def get(self):
+        if self.function is not None:
+            value = self.function()
+            return float("nan") if value is None else value
+        return self.value
+
+
+class Gauge(_Metric):
+    type_name = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value: float):
+        self._default().set(value)
+
+    def set_function(self, function):
+        self._default().set_function(function)
+
+    def _render_child(self, values, child):
+        return [f"{self.name}{_format_labels(self.labelnames, values)} {child.get()}"]
+
+
+class _HistogramChild:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self._default().observe(value)
+
+    def time(self):
+        return self._default().time()
+
+    def _render_child(self, values, child):
+        with child._lock:
+            counts, total = list(child.counts), child.sum
+        lines, cumulative = [], 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, values, ('le', le))} {cumulative}")
+        labels = _format_labels(self.labelnames, values)
+        lines.append(f"{self.name}_sum{labels} {total}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# --- Métricas de la API ---
+STAGE_SECONDS = registry.register(Histogram(
+    "aqi_stage_seconds", "Duración de cada etapa de /aqi", ["stage"]
+))
+CACHE_HITS = registry.register(Counter(
+    "aqi_cache_hits_total", "Hits acumulados por cache", ["cache"]
+))
+CACHE_MISSES = registry.register(Counter(
+    "aqi_cache_misses_total", "Misses acumulados por cache", ["cache"]
+))
+CACHE_HIT_RATIO = registry.register(Gauge(
+    "aqi_cache_hit_ratio", "Proporción de hits por cache", ["cache"]
+))
+CACHE_ENTRIES = registry.register(Gauge(
+    "aqi_cache_entries", "Entradas actuales por cache", ["cache"]
+))
+SNAPSHOT_LOAD_SECONDS = registry.register(Histogram(
+    "tempo_snapshot_load_seconds", "Duración de la carga de un snapshot TEMPO (descarga + build)",
+    buckets=(1, 2.5, 5, 10, 20, 30, 60, 120, 300),
+))
+SNAPSHOT_ROWS = registry.register(Gauge("tempo_snapshot_rows", "Filas del snapshot TEMPO actual"))
+SNAPSHOT_BYTES = registry.register(Gauge("tempo_snapshot_bytes", "Memoria del DataFrame del snapshot TEMPO actual"))
+SNAPSHOT_VERSION = registry.register(Gauge("tempo_snapshot_version", "Versión del snapshot TEMPO actual"))
+SNAPSHOT_AGE = registry.register(Gauge("tempo_snapshot_age_seconds", "Antigüedad del snapshot TEMPO actual"))
+SNAPSHOT_LOAD_ERRORS = registry.register(Counter(
+    "tempo_snapshot_load_errors_total", "Cargas de snapshot TEMPO fallidas"
+))
+UPSTREAM_REQUESTS = registry.register(Counter(
+    "openaq_requests_total", "Requests a OpenAQ por endpoint y resultado", ["endpoint", "outcome"]
+))
+ADMISSION_WAITING = registry.register(Gauge(
+    "openaq_admission_waiting", "Requests esperando turno en el token bucket de OpenAQ"
+))
+REQUESTS_SHED = registry.register(Counter(
+    "aqi_requests_shed_total", "Requests rechazados o degradados por sobrecarga", ["endpoint", "reason"]
+))
+API_INFLIGHT = registry.register(Gauge(
+    "aqi_requests_inflight", "Requests en curso en los endpoints con límite de concurrencia"
+))
+
+
+def stage(name: str):
+    """Context manager que mide una etapa en `aqi_stage_seconds{stage=name}`."""
+    return STAGE_SECONDS.labels(name).time()
+
+
+def track_cache(name: str, cache):
+    """Expone hits/misses/ratio/tamaño de un TTLCache, leídos al momento del scrape."""
+    CACHE_HITS.labels(name).set_function(lambda: cache.hits)
+    CACHE_MISSES.labels(name).set_function(lambda: cache.misses)
+    CACHE_ENTRIES.labels(name).set_function(lambda: len(cache))
+    CACHE_HIT_RATIO.labels(name).set_function(
+        lambda: cache.hits / (cache.hits + cache.misses) if cache.hits + cache.misses else None
+    )
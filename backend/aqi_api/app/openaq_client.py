@@ -0,0 +1,92 @@
+# app/openaq_client.py
+import asyncio
+import os
+import httpx
+
+from app.admission import UpstreamBusy
+from app.metrics import UPSTREAM_REQUESTS
+
+OPENAQ_BASE_URL = os.getenv("OPENAQ_BASE_URL", "https://api.openaq.org/v3")
+OPENAQ_TIMEOUT_S = float(os.getenv("OPENAQ_TIMEOUT_S", "10"))
+OPENAQ_MAX_CONNECTIONS = int(os.getenv("OPENAQ_MAX_CONNECTIONS", "20"))
+OPENAQ_MAX_CONCURRENCY = int(os.getenv("OPENAQ_MAX_CONCURRENCY", "10"))
+# OpenAQ actualiza como mucho cada hora; 15 min de TTL por defecto
+OPENAQ_LATEST_TTL_S = float(os.getenv("OPENAQ_LATEST_TTL_S", "900"))
+OPENAQ_LATEST_CACHE_SIZE = int(os.getenv("OPENAQ_LATEST_CACHE_SIZE", "5000"))
+
+
+class OpenAQClient:
+    """
+    Cliente async de OpenAQ con un único pool de conexiones compartido
+    (keep-alive), timeouts y un límite de requests concurrentes hacia upstream.
+    Con `admission` (AdmissionController) cada request consume presupuesto del
+    token bucket; si no hay turno a tiempo se levanta `UpstreamBusy` sin llamar.
+    Un 429 de upstream también se levanta como `UpstreamBusy` (con su Retry-After).
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        base_url: str = OPENAQ_BASE_URL,
+        timeout_s: float = OPENAQ_TIMEOUT_S,
+        max_connections: int = OPENAQ_MAX_CONNECTIONS,
+        max_concurrency: int = OPENAQ_MAX_CONCURRENCY,
+        admission=None,
+    ):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.timeout = httpx.Timeout(timeout_s, connect=min(timeout_s, 5.0))
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+            keepalive_expiry=60,
+        )
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.admission = admission
+        self._client = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # Se crea perezosamente dentro del event loop de la app
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers={"X-API-Key": self.api_key or ""},
+                timeout=self.timeout,
+                limits=self.limits,
+            )
+        return self._client
+
+    async def get(self, path: str, params: dict = None) -> httpx.Response:
+        endpoint = "latest" if path.endswith("/latest") else "locations"
+        if self.admission is not None:
+            try:
+                await self.admission.acquire()
+            except UpstreamBusy:
+                UPSTREAM_REQUESTS.labels(endpoint, "shed").inc()
+                raise
+        try:
+            async with self.semaphore:
+                r = await self.client.get(path, params=params)
+        except httpx.TimeoutException:
+            UPSTREAM_REQUESTS.labels(endpoint, "timeout").inc()
+            raise
+        except httpx.HTTPError:
+            UPSTREAM_REQUESTS.labels(endpoint, "error").inc()
+            raise
+        UPSTREAM_REQUESTS.labels(endpoint, "ok" if r.status_code < 400 else f"http_{r.status_code // 100}xx").inc()
+        if r.status_code == 429:
+            # Upstream saturado: frenar el bucket y degradar igual que un shed local
+            try:
+                retry_after = float(r.headers.get("Retry-After", "1"))
+            except ValueError:
+                retry_after = 1.0
+            if self.admission is not None:
+                self.admission.backoff(retry_after)
+            raise UpstreamBusy(retry_after)
+        return r
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
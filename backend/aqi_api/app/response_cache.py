@@ -0,0 +1,67 @@
+# app/response_cache.py
+import os
+
+from app.openaq_client import OPENAQ_LATEST_TTL_S
+from app.ttl_cache import SingleFlightCache
+
+AQI_CACHE_GEOHASH_PRECISION = int(os.getenv("AQI_CACHE_GEOHASH_PRECISION", "6"))
+AQI_CACHE_SIZE = int(os.getenv("AQI_CACHE_SIZE", "10000"))
+# Por defecto alineado a la frescura de las mediciones OpenAQ cacheadas
+AQI_CACHE_TTL_S = float(os.getenv("AQI_CACHE_TTL_S", str(OPENAQ_LATEST_TTL_S)))
+# TTL corto para respuestas armadas sin las mediciones de la estación (falló /latest)
+AQI_CACHE_NEGATIVE_TTL_S = float(os.getenv("AQI_CACHE_NEGATIVE_TTL_S", "30"))
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def geohash_encode(lat: float, lon: float, precision: int = AQI_CACHE_GEOHASH_PRECISION) -> str:
+    """Geohash estándar (base32) de `precision` caracteres."""
+    lat_lo, lat_hi = -90.0, 90.0
+    lon_lo, lon_hi = -180.0, 180.0
+    chars = []
+    bits, ch, even = 0, 0, True
+    while len(chars) < precision:
+        if even:
+            mid = (lon_lo + lon_hi) / 2
+            if lon >= mid:
+                ch = (ch << 1) | 1
+                lon_lo = mid
+            else:
+                ch <<= 1
+                lon_hi = mid
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            if lat >= mid:
+                ch = (ch << 1) | 1
+                lat_lo = mid
+            else:
+                ch <<= 1
+                lat_hi = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_BASE32[ch])
+            bits, ch = 0, 0
+    return "".join(chars)
+
+
+class AQIResponseCache(SingleFlightCache):
+    """
+    Cache de respuestas de /aqi por ubicación cuantizada (geohash) y versión
+    del snapshot TEMPO. Se vacía cuando TempoCache publica un snapshot nuevo.
+    """
+
+    def __init__(self, maxsize: int = AQI_CACHE_SIZE, ttl: float = AQI_CACHE_TTL_S,
+                 precision: int = AQI_CACHE_GEOHASH_PRECISION):
+        super().__init__(maxsize, ttl)
+        self.precision = precision
+
+    def key(self, lat: float, lon: float, version):
+        return geohash_encode(lat, lon, self.precision), version
+
+    def on_snapshot_swap(self, snapshot):
+        self.clear()
+
+
+# instancia global
+aqi_response_cache = AQIResponseCache()
@@ -0,0 +1,221 @@
+# backend/aqi_api/app/routers/tiles.py
+import math
+import os
+import struct
+import zlib
+import numpy as np
+from fastapi import APIRouter, HTTPException, Query, Response
+
+from app.tempo_cache import tempo_cache
+from app.tempo_index import TempoIndex
+from app.ttl_cache import TTLCache, MISSING
+
+router = APIRouter(prefix="/tiles", tags=["tiles"])
+
+TILE_SIZE = 256
+TILE_CACHE_SIZE = int(os.getenv("TILE_CACHE_SIZE", "2048"))
+TILE_MAX_ZOOM = int(os.getenv("TILE_MAX_ZOOM", "12"))
+# Tamaño aproximado (grados) de un píxel TEMPO: con píxeles de tile más chicos que esto
+# se muestrea el píxel más cercano (sin huecos) en vez de promediar por píxel de tile
+TILE_TEMPO_PIXEL_DEG = float(os.getenv("TILE_TEMPO_PIXEL_DEG", "0.05"))
+
+# producto → (capa del snapshot, vmin, vmax) para la rampa de color
+TILE_PRODUCTS = {
+    "no2": ("no2", 0.0, 2e16),
+    "o3tot": ("o3tot", 200.0, 500.0),
+    "o3prof": ("o3prof", 0.0, 20.0),
+    "hcho": ("hcho", 0.0, 4e16),
+    "aqi": ("tempo_aqi_value", 0.0, 300.0),
+}
+
+# Rampa verde → amarillo → naranja → rojo → violeta (colores EPA)
+_RAMP_STOPS = np.array([0.0, 0.25, 0.5, 0.75, 1.0])
+_RAMP_RGB = np.array([
+    [0, 228, 0],
+    [255, 255, 0],
+    [255, 126, 0],
+    [255, 0, 0],
+    [143, 63, 151],
+], dtype=np.float64)
+_ALPHA = 170
+
+# (versión del snapshot, producto, z, x, y, formato) → (bytes, media type)
+tile_cache = TTLCache(maxsize=TILE_CACHE_SIZE)
+
+
+def encode_png_rgba(rgba: np.ndarray) -> bytes:
+    """PNG RGBA 8-bit mínimo (sin dependencias extra)."""
+    height, width, _ = rgba.shape
+    # Filtro 0 (None) al inicio de cada fila
+    raw = np.empty((height, width * 4 + 1), dtype=np.uint8)
+    raw[:, 0] = 0
+    raw[:, 1:] = rgba.reshape(height, width * 4)
+
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF)
+
+    ihdr = struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", ihdr)
+        + chunk(b"IDAT", zlib.compress(raw.tobytes(), 6))
+        + chunk(b"IEND", b"")
+    )
+
+
+def tile_pixel_centers(z: int, x: int, y: int):
+    """Lat/lon (grados) de los centros de píxel de un tile Web Mercator (XYZ)."""
+    n = 2 ** z * TILE_SIZE
+    px = (x * TILE_SIZE + np.arange(TILE_SIZE) + 0.5) / n
+    py = (y * TILE_SIZE + np.arange(TILE_SIZE) + 0.5) / n
+    lons = px * 360.0 - 180.0
+    lats = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * py))))
+    return lats, lons
+
+
+def tile_bounds(z: int, x: int, y: int):
+    """(min_lat, min_lon, max_lat, max_lon) del tile."""
+    n = 2 ** z
+    lon_min = x / n * 360.0 - 180.0
+    lon_max = (x + 1) / n * 360.0 - 180.0
+    lat_max = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+    lat_min = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y + 1) / n))))
+    return lat_min, lon_min, lat_max, lon_max
+
+
+def sample_raster(raster, layer: str, z: int, x: int, y: int) -> np.ndarray:
+    """Grilla (256, 256) float32 muestreada de la grilla regular del snapshot (aritmética de índices)."""
+    lats, lons = tile_pixel_centers(z, x, y)
+    i = np.floor((lats - raster.lat0) / raster.res).astype(np.int64)
+    j = np.floor((lons - raster.lon0) / raster.res).astype(np.int64)
+    ok_i = (i >= 0) & (i < raster.nlat)
+    ok_j = (j >= 0) & (j < raster.nlon)
+
+    grid = np.full((TILE_SIZE, TILE_SIZE), np.nan, dtype=np.float32)
+    if ok_i.any() and ok_j.any():
+        sub = raster.layers[layer][np.ix_(i[ok_i], j[ok_j])]
+        grid[np.ix_(ok_i, ok_j)] = sub
+    return grid
+
+
+def bin_pixels(snapshot, layer: str, z: int, x: int, y: int) -> np.ndarray:
+    """
+    Grilla (256, 256) float32 promediando los píxeles TEMPO que caen en cada
+    píxel del tile (bincount vectorizado). Se usa en zooms bajos si la grilla regular
+    está deshabilitada.
+    """
+    cols = snapshot.columns
+    lat_min, lon_min, lat_max, lon_max = tile_bounds(z, x, y)
+    lat, lon, vals = cols["lat"], cols["lon"], cols[layer]
+    inside = (lat >= lat_min) & (lat < lat_max) & (lon >= lon_min) & (lon < lon_max) & ~np.isnan(vals)
+
+    grid = np.full(TILE_SIZE * TILE_SIZE, np.nan, dtype=np.float32)
+    if not inside.any():
+        return grid.reshape(TILE_SIZE, TILE_SIZE)
+
+    n = 2 ** z * TILE_SIZE
+    lat_r = np.radians(lat[inside].astype(np.float64))
+    px = ((lon[inside] + 180.0) / 360.0 * n - x * TILE_SIZE).astype(np.int64)
+    py = ((1 - np.log(np.tan(lat_r) + 1 / np.cos(lat_r)) / np.pi) / 2 * n - y * TILE_SIZE).astype(np.int64)
+    px = np.clip(px, 0, TILE_SIZE - 1)
+    py = np.clip(py, 0, TILE_SIZE - 1)
+
+    flat = py * TILE_SIZE + px
+    counts = np.bincount(flat, minlength=TILE_SIZE * TILE_SIZE)
+    sums = np.bincount(flat, weights=vals[inside].astype(np.float64), minlength=TILE_SIZE * TILE_SIZE)
+    has = counts > 0
+    grid[has] = sums[has] / counts[has]
+    return grid.reshape(TILE_SIZE, TILE_SIZE)
+
+
+def sample_nearest(snapshot, layer: str, z: int, x: int, y: int) -> np.ndarray:
+    """
+    Grilla (256, 256) float32 con el píxel TEMPO más cercano a cada centro de
+    píxel del tile. Para zooms donde un píxel de tile es más chico que uno TEMPO
+    (el binning dejaría la mayoría vacíos). Se arma un índice chico solo con los
+    píxeles del bbox del tile, con celdas del tamaño de un píxel TEMPO.
+    Los centros a más de `TILE_TEMPO_PIXEL_DEG` de cualquier píxel quedan en NaN.
+    """
+    grid = np.full(TILE_SIZE * TILE_SIZE, np.nan, dtype=np.float32)
+    lat_min, lon_min, lat_max, lon_max = tile_bounds(z, x, y)
+    pad = TILE_TEMPO_PIXEL_DEG
+    rows = snapshot.index.rows_in_bbox(lat_min - pad, lon_min - pad, lat_max + pad, lon_max + pad)
+    if not len(rows):
+        return grid.reshape(TILE_SIZE, TILE_SIZE)
+
+    cols = snapshot.columns
+    local = TempoIndex.build(cols["lat"][rows], cols["lon"][rows], cell=TILE_TEMPO_PIXEL_DEG)
+    lats, lons = tile_pixel_centers(z, x, y)
+    grid_lat, grid_lon = np.meshgrid(lats, lons, indexing="ij")
+    _, pos = local.nearest_many(grid_lat.ravel(), grid_lon.ravel(), max_dist=TILE_TEMPO_PIXEL_DEG)
+
+    found = pos >= 0
+    grid[found] = np.asarray(cols[layer])[rows[pos[found]]]
+    return grid.reshape(TILE_SIZE, TILE_SIZE)
+
+
+def colorize(grid: np.ndarray, vmin: float, vmax: float) -> np.ndarray:
+    """float32 (H, W) → RGBA uint8, transparente donde no hay datos."""
+    norm = np.clip((grid - vmin) / (vmax - vmin), 0.0, 1.0)
+    valid = ~np.isnan(grid)
+    rgba = np.zeros(grid.shape + (4,), dtype=np.uint8)
+    for c in range(3):
+        rgba[..., c] = np.interp(np.where(valid, norm, 0.0), _RAMP_STOPS, _RAMP_RGB[:, c]).astype(np.uint8)
+    rgba[..., 3] = np.where(valid, _ALPHA, 0)
+    return rgba
+
+
+def render_tile(snapshot, product: str, z: int, x: int, y: int, fmt: str):
+    layer, vmin, vmax = TILE_PRODUCTS[product]
+    if snapshot.raster is not None and layer in snapshot.raster.layers:
+        grid = sample_raster(snapshot.raster, layer, z, x, y)
+    elif layer in snapshot.columns and 360.0 / (2 ** z * TILE_SIZE) < TILE_TEMPO_PIXEL_DEG:
+        grid = sample_nearest(snapshot, layer, z, x, y)
+    elif layer in snapshot.columns:
+        grid = bin_pixels(snapshot, layer, z, x, y)
+    else:
+        grid = np.full((TILE_SIZE, TILE_SIZE), np.nan, dtype=np.float32)
+
+    if fmt == "bin":
+        # float32 little-endian, fila 0 = norte; NaN = sin datos
+        return grid.astype("<f4").tobytes(), "application/octet-stream"
+    return encode_png_rgba(colorize(grid, vmin, vmax)), "image/png"
+
+
+@router.get("/{product}/{z}/{x}/{y}")
+def get_tile(
+    product: str,
+    z: int,
+    x: int,
+    y: int,
+    format: str = Query("png", pattern="^(png|bin)$"),
+):
+    """
+    Tile XYZ (Web Mercator, 256×256) del snapshot TEMPO actual, como PNG
+    coloreado o como grilla binaria float32. Los tiles se cachean en memoria
+    por versión de snapshot (LRU).
+    """
+    if product not in TILE_PRODUCTS:
+        raise HTTPException(status_code=404, detail=f"Producto desconocido: {product}")
+    if not (0 <= z <= TILE_MAX_ZOOM and 0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        raise HTTPException(status_code=404, detail="Tile fuera de rango")
+
+    try:
+        snapshot = tempo_cache.get_snapshot()
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"TEMPO no disponible: {e}", headers={"Retry-After": "5"})
+
+    key = (snapshot.version, product, z, x, y, format)
+    cached = tile_cache.get(key)
+    if cached is MISSING:
+        cached = render_tile(snapshot, product, z, x, y, format)
+        tile_cache.set(key, cached)
+    content, media_type = cached
+
+    headers = {
+        "Cache-Control": "public, max-age=300",
+        "ETag": f'"{snapshot.version}-{product}-{z}-{x}-{y}-{format}"',
+    }
+    if format == "bin":
+        headers.update({"X-Tile-Width": str(TILE_SIZE), "X-Tile-Height": str(TILE_SIZE), "X-Tile-Dtype": "float32"})
+    return Response(content=content, media_type=media_type, headers=headers)
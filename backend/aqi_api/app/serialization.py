@@ -0,0 +1,89 @@
+# app/serialization.py
+import json
+import numpy as np
+import orjson
+import pandas as pd
+from fastapi.responses import JSONResponse
+
+try:  # opcional: solo para /aqi/batch en MessagePack
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON_MEDIA_TYPE = "application/json"
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+
+# NaN/inf → null lo resuelve orjson de forma nativa (también dentro de arrays numpy)
+ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+def _default(obj):
+    """Tipos que orjson no serializa directo: arrays object/no contiguos, escalares pandas."""
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, pd.Timestamp):
+        return obj.isoformat()
+    if obj is pd.NA or obj is pd.NaT:
+        return None
+    raise TypeError(f"Tipo no serializable: {type(obj).__name__}")
+
+
+def dumps(obj) -> bytes:
+    """Serializa a JSON directo desde valores numpy/pandas (sin copia intermedia ni sanitize)."""
+    return orjson.dumps(obj, default=_default, option=ORJSON_OPTIONS)
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse que renderiza con orjson (NaN/inf → null)."""
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+def prepend_field(body: bytes, name: str, value) -> bytes:
+    """Agrega `name: value` al inicio de un objeto JSON ya serializado (sin re-serializarlo)."""
+    head = dumps({name: value})
+    if body == b"{}":
+        return head
+    return head[:-1] + b"," + body[1:]
+
+
+def negotiate_format(accept: str = None, fmt: str = None) -> str:
+    """'json' | 'msgpack' | 'arrow', según `?format=` o el header Accept."""
+    if fmt:
+        return fmt
+    accept = accept or ""
+    if MSGPACK_MEDIA_TYPE in accept or "application/x-msgpack" in accept:
+        return "msgpack"
+    if ARROW_MEDIA_TYPE in accept:
+        return "arrow"
+    return "json"
+
+
+def to_msgpack(obj) -> bytes:
+    """MessagePack (dependencia opcional `msgpack`)."""
+    def default(o):
+        if isinstance(o, np.ndarray):
+            return o.tolist()
+        return _default(o)
+
+    return msgpack.packb(obj, default=default)
+
+
+def to_arrow_stream(columns: dict, metadata: dict = None) -> bytes:
+    """
+    Columnas alineadas (arrays numpy) → Arrow IPC stream. Los metadatos no tabulares
+    van como JSON en los metadatos del schema.
+    """
+    import pyarrow as pa
+
+    table = pa.table({name: pa.array(values) for name, values in columns.items()})
+    if metadata:
+        table = table.replace_schema_metadata({k: json.dumps(v) for k, v in metadata.items()})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
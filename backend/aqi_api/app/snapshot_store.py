@@ -0,0 +1,199 @@
+# app/snapshot_store.py
+import json
+import os
+import shutil
+import tempfile
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from app.core import AQI_CATEGORY_LABELS
+from app.tempo_raster import TempoRaster
+from app.tempo_index import TempoIndex
+
+try:  # lock de refresher entre procesos (Linux/macOS)
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Directorio compartido por todos los workers del host ("" lo deshabilita)
+TEMPO_SHARED_DIR = os.getenv("TEMPO_SHARED_DIR", os.path.join(tempfile.gettempdir(), "tempo_shared"))
+# Versiones que se conservan en disco (un worker puede seguir sirviendo la anterior)
+TEMPO_SHARED_KEEP = int(os.getenv("TEMPO_SHARED_KEEP", "2"))
+# Cada cuánto los workers no-refresher revisan si hay una versión nueva
+TEMPO_SHARED_POLL_S = float(os.getenv("TEMPO_SHARED_POLL_S", "5"))
+# Espera máxima de un worker en frío a que el refresher publique la primera versión
+TEMPO_SHARED_WAIT_S = float(os.getenv("TEMPO_SHARED_WAIT_S", "300"))
+
+CURRENT_FILE = "CURRENT"
+LOCK_FILE = "refresher.lock"
+COLUMNS_FILE = "columns.arrow"
+
+
+class SharedSnapshotStore:
+    """
+    Snapshot TEMPO materializado una vez por host y mapeado en memoria por
+    todos los workers.
+
+    - Cada versión es un directorio con las columnas en un archivo Arrow IPC
+      sin comprimir, el índice espacial y las capas de la grilla regular como
+      `.npy`; los workers los abren con mmap (sin copia, páginas compartidas
+      por el kernel), así que ningún worker arma estructuras privadas por píxel.
+    - Un solo proceso por host (el que tiene el `flock` de `refresher.lock`)
+      descarga y publica; el lock se libera solo si el proceso muere.
+    - La publicación es atómica: el directorio se escribe con un nombre
+      temporal, se renombra y recién después se reemplaza `CURRENT`.
+    """
+
+    def __init__(self, directory: str = TEMPO_SHARED_DIR, keep: int = TEMPO_SHARED_KEEP):
+        self.directory = directory
+        self.keep = max(keep, 1)
+        self._lock_fd = None
+
+    @property
+    def is_refresher(self) -> bool:
+        return self._lock_fd is not None
+
+    def acquire_refresher(self) -> bool:
+        """Intenta ser el refresher del host (no bloqueante). Idempotente."""
+        if self._lock_fd is not None:
+            return True
+        if fcntl is None:
+            self._lock_fd = -1
+            return True
+        # El directorio se crea recién al primer uso (importar la app no toca el disco)
+        os.makedirs(self.directory, exist_ok=True)
+        fd = os.open(os.path.join(self.directory, LOCK_FILE), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self._lock_fd = fd
+        return True
+
+    def current(self):
+        """Metadatos de la versión publicada (dict) o None si todavía no hay ninguna."""
+        try:
+            with open(os.path.join(self.directory, CURRENT_FILE)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def current_version(self) -> int:
+        meta = self.current()
+        return meta["version"] if meta else 0
+
+    def publish(self, version: int, loaded_at: datetime, columns: dict, raster=None, source=None,
+                index=None) -> dict:
+        """Escribe una versión nueva y la publica de forma atómica. Devuelve sus metadatos."""
+        name = f"v{version:08d}"
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(prefix=f".{name}.", dir=self.directory)
+        try:
+            _write_columns(os.path.join(tmp_dir, COLUMNS_FILE), columns)
+            index_meta = None
+            if index is not None:
+                for part, values in index.arrays.items():
+                    np.save(os.path.join(tmp_dir, f"index_{part}.npy"), values)
+                index_meta = index.meta
+            raster_meta = None
+            if raster is not None:
+                for layer, values in raster.layers.items():
+                    np.save(os.path.join(tmp_dir, f"raster_{layer}.npy"), values)
+                raster_meta = {
+                    "lat0": raster.lat0, "lon0": raster.lon0, "res": raster.res,
+                    "layers": list(raster.layers),
+                }
+            final_dir = os.path.join(self.directory, name)
+            shutil.rmtree(final_dir, ignore_errors=True)
+            os.rename(tmp_dir, final_dir)
+        except Exception:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+        meta = {
+            "version": version,
+            "path": name,
+            "loaded_at": loaded_at.isoformat(),
+            "rows": len(columns["lat"]),
+            "raster": raster_meta,
+            "index": index_meta,
+            "source": source or {},
+        }
+        fd, tmp_current = tempfile.mkstemp(prefix=".CURRENT.", dir=self.directory)
+        with os.fdopen(fd, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp_current, os.path.join(self.directory, CURRENT_FILE))
+
+        self._cleanup(keep_name=name)
+        return meta
+
+    def open(self, meta: dict):
+        """
+        Mapea una versión publicada: (columnas como arrays numpy sobre el mmap,
+        TempoRaster con capas `np.memmap` o None, TempoIndex sobre `np.memmap` o None).
+        """
+        base = os.path.join(self.directory, meta["path"])
+        table = pa.ipc.open_file(pa.memory_map(os.path.join(base, COLUMNS_FILE), "r")).read_all()
+        columns = {}
+        for name in table.column_names:
+            chunks = table.column(name).chunks
+            arr = chunks[0] if len(chunks) == 1 else pa.concat_arrays(chunks)
+            if pa.types.is_dictionary(arr.type):
+                codes = arr.indices.to_numpy(zero_copy_only=True)
+                columns[name] = pd.Categorical.from_codes(codes, categories=AQI_CATEGORY_LABELS)
+            else:
+                columns[name] = arr.to_numpy(zero_copy_only=True)
+
+        raster = None
+        raster_meta = meta.get("raster")
+        if raster_meta:
+            layers = {
+                layer: np.load(os.path.join(base, f"raster_{layer}.npy"), mmap_mode="r")
+                for layer in raster_meta["layers"]
+            }
+            raster = TempoRaster(raster_meta["lat0"], raster_meta["lon0"], raster_meta["res"], layers)
+
+        index = None
+        index_meta = meta.get("index")
+        if index_meta:
+            arrays = {
+                part: np.load(os.path.join(base, f"index_{part}.npy"), mmap_mode="r")
+                for part in ("order", "offsets")
+            }
+            index = TempoIndex.from_arrays(columns["lat"], columns["lon"], arrays, index_meta)
+        return columns, raster, index
+
+    def _cleanup(self, keep_name: str):
+        versions = sorted(
+            d for d in os.listdir(self.directory)
+            if d.startswith("v") and os.path.isdir(os.path.join(self.directory, d))
+        )
+        # Borrar un directorio mapeado es seguro: el mmap sigue vivo hasta que el worker lo suelta
+        for d in versions[:-self.keep]:
+            if d != keep_name:
+                shutil.rmtree(os.path.join(self.directory, d), ignore_errors=True)
+
+
+def _write_columns(path: str, columns: dict):
+    """Columnas → Arrow IPC (un solo record batch, sin compresión, NaN sin bitmap de nulls)."""
+    arrays = {}
+    for name, values in columns.items():
+        if isinstance(values, pd.Categorical):
+            arrays[name] = pa.DictionaryArray.from_arrays(
+                pa.array(values.codes, type=pa.int8()), pa.array(AQI_CATEGORY_LABELS.tolist())
+            )
+        else:
+            arrays[name] = pa.array(np.ascontiguousarray(values))
+    table = pa.table(arrays)
+    with pa.OSFile(path, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+
+# instancia global (None si está deshabilitado)
+shared_store = SharedSnapshotStore() if TEMPO_SHARED_DIR else None
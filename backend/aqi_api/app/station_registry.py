@@ -0,0 +1,89 @@
+# app/station_registry.py
+import asyncio
+import os
+from datetime import datetime
+import numpy as np
+from scipy.spatial import cKDTree
+
+from app.core import latlon_to_xyz, match_nearest_stations
+
+# Cobertura por defecto: misma caja que el mapa del frontend (minLon,minLat,maxLon,maxLat)
+REGISTRY_BBOX = os.getenv("OPENAQ_REGISTRY_BBOX", "-167,5,-10,83")
+REGISTRY_REFRESH_S = float(os.getenv("OPENAQ_REGISTRY_REFRESH_S", str(12 * 3600)))
+REGISTRY_RETRY_S = float(os.getenv("OPENAQ_REGISTRY_RETRY_S", "300"))
+REGISTRY_PAGE_SIZE = 1000
+REGISTRY_MAX_PAGES = int(os.getenv("OPENAQ_REGISTRY_MAX_PAGES", "100"))
+
+
+class _RegistryState:
+    """Estado inmutable del registro; se reemplaza completo en cada refresh."""
+
+    def __init__(self, stations: list):
+        self.stations = stations
+        self.lat = np.array([s["coordinates"]["latitude"] for s in stations], dtype=np.float64)
+        self.lon = np.array([s["coordinates"]["longitude"] for s in stations], dtype=np.float64)
+        self.tree = cKDTree(latlon_to_xyz(self.lat, self.lon)) if stations else None
+        self.loaded_at = datetime.utcnow()
+
+
+class StationRegistry:
+    """
+    Registro en memoria de estaciones OpenAQ con índice espacial.
+    Las ubicaciones casi no cambian, así que se refrescan periódicamente
+    y la búsqueda de la estación más cercana es local (sin llamada remota).
+    """
+
+    def __init__(self, bbox: str = REGISTRY_BBOX):
+        self.bbox = bbox
+        self.state = None
+
+    @property
+    def ready(self) -> bool:
+        return self.state is not None and len(self.state.stations) > 0
+
+    async def refresh(self, client):
+        stations = []
+        for page in range(1, REGISTRY_MAX_PAGES + 1):
+            r = await client.get(
+                "/locations",
+                params={"bbox": self.bbox, "limit": REGISTRY_PAGE_SIZE, "page": page},
+            )
+            r.raise_for_status()
+            results = r.json().get("results", [])
+            stations.extend(s for s in results if s.get("coordinates"))
+            if len(results) < REGISTRY_PAGE_SIZE:
+                break
+
+        # El KD-tree se arma fuera del event loop y luego se publica de una vez
+        self.state = await asyncio.to_thread(_RegistryState, stations)
+        print(f"[STATION REGISTRY] {len(stations):,} estaciones cargadas.")
+
+    async def run(self, client):
+        """Loop de refresco periódico (pensado para correr como task en el lifespan)."""
+        while True:
+            try:
+                await self.refresh(client)
+                delay = REGISTRY_REFRESH_S
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[STATION REGISTRY] Error refrescando estaciones: {e}")
+                delay = REGISTRY_RETRY_S
+            await asyncio.sleep(delay)
+
+    def nearest(self, lat: float, lon: float, radius_km: float = 25):
+        """Estación más cercana dentro de `radius_km` (copia con `distance_km`), o None."""
+        state = self.state
+        idx, dist = self.nearest_many(np.array([lat]), np.array([lon]), radius_km, state=state)
+        if idx[0] < 0:
+            return None
+        return {**state.stations[idx[0]], "distance_km": float(dist[0])}
+
+    def nearest_many(self, lats, lons, radius_km: float = 25, state=None):
+        """Versión vectorizada: (índices en `state.stations`, distancias km); -1 si no hay."""
+        state = state or self.state
+        return match_nearest_stations(lats, lons, state.lat, state.lon, radius_km, tree=state.tree)
+
+
+# instancia global
+station_registry = StationRegistry()
@@ -1,57 +1,374 @@
 # app/tempo_cache.py
+import os
+import random
 import time
 import threading
 from datetime import datetime, timedelta
+import numpy as np
 import pandas as pd
-from app.azure_blob_reader import load_latest_parquet_from_blob
+from app.azure_blob_reader import load_latest_parquet_from_blob, load_local_parquet, TEMPO_BBOX
+from app.tempo_index import TempoIndex
+from app.tempo_raster import TempoRaster
+from app.core import add_tempo_aqi_columns
+from app import metrics
+from app.snapshot_store import shared_store, TEMPO_SHARED_POLL_S, TEMPO_SHARED_WAIT_S
 
 CACHE_TTL = timedelta(hours=2)
+REFRESH_BACKOFF_BASE_S = 30
+REFRESH_BACKOFF_MAX_S = 15 * 60
+COLD_LOAD_ERROR_HOLD_S = 5
+# Resolución de la grilla regular (grados); 0 la deshabilita. Se construye además
+# de las columnas por píxel (no las reemplaza), así que viene apagada por defecto;
+# habilitarla (p.ej. 0.05) para TEMPO_POINT_LOOKUP=raster y tiles desde la grilla
+TEMPO_RASTER_RES_DEG = float(os.getenv("TEMPO_RASTER_RES_DEG", "0"))
+
+
+class SnapshotNotReady(RuntimeError):
+    """El warm-up en segundo plano todavía no publicó el primer snapshot."""
+
+
+class TempoSnapshot:
+    """
+    Snapshot inmutable de TEMPO: DataFrame + índice espacial + columnas como arrays.
+    Incluye el AQI TEMPO precalculado por píxel, así que servir un punto es un lookup de fila.
+    Se construye completo fuera del lock y se reemplaza de forma atómica.
+    """
+
+    def __init__(self, df: pd.DataFrame, version: int):
+        self._df = add_tempo_aqi_columns(df)
+        # Vistas de cada columna para lookups por fila sin crear Series
+        # (la categoría queda como Categorical: códigos int8, no strings por fila)
+        columns = {
+            c: df[c].array if isinstance(df[c].dtype, pd.CategoricalDtype) else np.asarray(df[c])
+            for c in df.columns
+        }
+        self._setup(columns, version, datetime.utcnow(), source=dict(df.attrs))
+
+    @classmethod
+    def from_columns(cls, columns: dict, version: int, loaded_at: datetime, raster=None, source=None,
+                     index=None):
+        """Snapshot sobre columnas ya calculadas (p.ej. mapeadas desde el store compartido)."""
+        snap = cls.__new__(cls)
+        snap._df = None
+        snap._setup(columns, version, loaded_at, raster, source, index)
+        return snap
+
+    def _setup(self, columns: dict, version: int, loaded_at: datetime, raster=None, source=None,
+               index=None):
+        self.version = version
+        self.loaded_at = loaded_at
+        # Blob de origen (`source_blob`, `source_time`), si se conoce
+        self.source = source or {}
+        self.columns = columns
+        # Índice de grilla: arrays planos, mapeados desde el store compartido si existe
+        self.index = index if index is not None else TempoIndex.build(columns["lat"], columns["lon"])
+        if raster is None and TEMPO_RASTER_RES_DEG > 0 and len(columns["lat"]):
+            raster = TempoRaster.from_columns(columns, TEMPO_RASTER_RES_DEG, bbox=TEMPO_BBOX)
+        self.raster = raster
+
+    @property
+    def df(self) -> pd.DataFrame:
+        # Los snapshots mapeados no tienen DataFrame; se arma (con copia) solo si alguien lo pide
+        if self._df is None:
+            self._df = pd.DataFrame(self.columns)
+        return self._df
+
+    @property
+    def nbytes(self) -> int:
+        return int(sum(col.nbytes for col in self.columns.values()))
+
+    def __len__(self):
+        return len(self.columns["lat"])
+
+    def row(self, pos: int) -> dict:
+        out = {}
+        for c, arr in self.columns.items():
+            v = arr[pos]
+            out[c] = v.item() if isinstance(v, np.generic) else v
+        return out
+
 
 class TempoCache:
-    def __init__(self):
-        self.df = None
+    """
+    Cache en memoria del último snapshot TEMPO.
+
+    - Carga single-flight: un solo hilo descarga/parsea; el resto espera
+      (cold start) o sigue sirviendo el snapshot anterior (refresh).
+    - Doble buffer: el próximo snapshot se construye completo y se publica
+      con un swap atómico.
+    - Los refresh fallidos se reintentan con backoff exponencial.
+    - Al reiniciar se sirve la copia local en disco y se revalida en segundo
+      plano; si el blob no cambió (mismo ETag) no se descarga de nuevo.
+    - Con `shared` (SharedSnapshotStore), un solo worker por host descarga y
+      publica el snapshot; el resto mapea la versión publicada (sin copia).
+    """
+
+    def __init__(self, shared=shared_store):
+        self.shared = shared
+        self.snapshot = None
         self.last_update = None
         self.lock = threading.Lock()
-        self._start_background_refresh()
+        self._load_lock = threading.Lock()
+        self._version = 0
+        self.refreshing = False
+        self.last_error = None
+        self.last_error_at = None
+        self.consecutive_failures = 0
+        self.next_refresh_at = None
+        self._swap_listeners = []
+        self._thread = None
+        # El snapshot actual viene de una copia local/compartida y falta chequearlo contra Blob
+        self._revalidate = False
+        metrics.SNAPSHOT_AGE.set_function(lambda: self.age_seconds)
+
+    @property
+    def df(self):
+        snap = self.snapshot
+        return snap.df if snap is not None else None
+
+    @property
+    def version(self):
+        snap = self.snapshot
+        return snap.version if snap is not None else None
+
+    @property
+    def age_seconds(self):
+        snap = self.snapshot
+        return (datetime.utcnow() - snap.loaded_at).total_seconds() if snap is not None else None
+
+    @property
+    def ready(self) -> bool:
+        return self.snapshot is not None
+
+    def start(self):
+        """
+        Arranca el hilo de refresh (idempotente). La primera vuelta hace el
+        warm-up: no bloquea el arranque de la API y, mientras no haya snapshot,
+        `get_snapshot` responde `SnapshotNotReady` en lugar de cargar en el request.
+        """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._auto_refresh, name="tempo-refresh", daemon=True)
+            self._thread.start()
+
+    def _build_snapshot(self, df: pd.DataFrame) -> TempoSnapshot:
+        with self.lock:
+            if self.shared is not None:
+                # Versiones monótonas en el host aunque cambie el refresher
+                self._version = max(self._version, self.shared.current_version())
+            self._version += 1
+            version = self._version
+        return TempoSnapshot(df, version)
+
+    def on_swap(self, callback):
+        """Registra `callback(snapshot)`, llamado cada vez que se publica un snapshot nuevo."""
+        self._swap_listeners.append(callback)
+
+    def _swap(self, snap: TempoSnapshot):
+        with self.lock:
+            self.snapshot = snap
+            self.last_update = snap.loaded_at
+        for callback in list(self._swap_listeners):
+            try:
+                callback(snap)
+            except Exception as e:
+                print(f"[TEMPO CACHE] Error en listener de swap: {e}")
+
+    def _publish_metrics(self, snap: TempoSnapshot):
+        metrics.SNAPSHOT_ROWS.set(len(snap))
+        metrics.SNAPSHOT_BYTES.set(snap.nbytes)
+        metrics.SNAPSHOT_VERSION.set(snap.version)
+
+    def _adopt_shared(self):
+        """Mapea la versión publicada en el store compartido si es más nueva que la actual."""
+        meta = self.shared.current()
+        current = self.snapshot
+        if meta is None or (current is not None and meta["version"] <= current.version):
+            return None
+        columns, raster, index = self.shared.open(meta)
+        snap = TempoSnapshot.from_columns(
+            columns, meta["version"], datetime.fromisoformat(meta["loaded_at"]),
+            raster=raster, source=meta.get("source"), index=index,
+        )
+        self._swap(snap)
+        self._publish_metrics(snap)
+        return snap
+
+    def _wait_for_shared(self) -> TempoSnapshot:
+        """Worker no-refresher: espera a que el refresher del host publique una versión nueva."""
+        deadline = time.monotonic() + TEMPO_SHARED_WAIT_S
+        while True:
+            snap = self._adopt_shared()
+            if snap is not None:
+                return snap
+            if time.monotonic() > deadline:
+                raise TimeoutError("El refresher no publicó un snapshot TEMPO a tiempo")
+            time.sleep(min(TEMPO_SHARED_POLL_S, 1.0))
+
+    def _publish_df(self, df: pd.DataFrame) -> TempoSnapshot:
+        snap = self._build_snapshot(df)
+        if self.shared is not None:
+            # Se publica y se sirve la copia mapeada (libera el DataFrame privado)
+            meta = self.shared.publish(
+                snap.version, snap.loaded_at, snap.columns, snap.raster, snap.source, snap.index
+            )
+            del df
+            columns, raster, index = self.shared.open(meta)
+            snap = TempoSnapshot.from_columns(
+                columns, snap.version, snap.loaded_at, raster=raster, source=snap.source, index=index
+            )
+        self._swap(snap)
+        self._publish_metrics(snap)
+        return snap
+
+    def _warm_start(self):
+        """
+        Refresher sin snapshot: sirve de inmediato la versión publicada en el host
+        o la copia local en disco, y la marca para revalidar contra Blob.
+        """
+        with self._load_lock:
+            snap = self._adopt_shared() if self.shared is not None else None
+            if snap is None:
+                df = load_local_parquet()
+                if df is not None:
+                    snap = self._publish_df(df)
+            if snap is not None:
+                self._revalidate = True
+                print(f"[TEMPO CACHE] Warm start from local copy (v{snap.version}, {len(snap):,} rows); revalidating.")
 
-    def _start_background_refresh(self):
-        t = threading.Thread(target=self._auto_refresh, daemon=True)
-        t.start()
+    def _load(self) -> TempoSnapshot:
+        """Descarga y construye el próximo snapshot y lo publica. Llamar con `_load_lock` tomado."""
+        self.refreshing = True
+        start = time.perf_counter()
+        try:
+            if self.shared is not None and not self.shared.acquire_refresher():
+                snap = self._wait_for_shared()
+            else:
+                current = self.snapshot
+                etag = current.source.get("source_etag") if current is not None else None
+                df = load_latest_parquet_from_blob(if_none_match=etag)
+                if df is None:
+                    # Blob sin cambios: el snapshot actual sigue vigente por otro TTL
+                    with self.lock:
+                        self.last_update = datetime.utcnow()
+                    snap = current
+                else:
+                    snap = self._publish_df(df)
+                    metrics.SNAPSHOT_LOAD_SECONDS.observe(time.perf_counter() - start)
+                self._revalidate = False
+            self.consecutive_failures = 0
+            self.last_error = None
+            return snap
+        except Exception as e:
+            metrics.SNAPSHOT_LOAD_ERRORS.inc()
+            self.consecutive_failures += 1
+            self.last_error = str(e)
+            self.last_error_at = datetime.utcnow()
+            raise
+        finally:
+            self.refreshing = False
+
+    def refresh(self, blocking: bool = False):
+        """
+        Fuerza un refresh. Si ya hay uno en curso y `blocking` es False,
+        no hace nada y devuelve el snapshot actual (stale-while-revalidate).
+        """
+        if not self._load_lock.acquire(blocking=blocking):
+            return self.snapshot
+        try:
+            return self._load()
+        finally:
+            self._load_lock.release()
+
+    def _retry_delay(self) -> float:
+        delay = min(REFRESH_BACKOFF_BASE_S * 2 ** (self.consecutive_failures - 1), REFRESH_BACKOFF_MAX_S)
+        return delay * random.uniform(0.8, 1.2)
 
     def _auto_refresh(self):
         while True:
+            if self.shared is not None and not self.shared.acquire_refresher():
+                # Otro worker del host es el refresher: solo seguir sus publicaciones
+                try:
+                    with self._load_lock:
+                        snap = self._adopt_shared()
+                    if snap is not None:
+                        print(f"[TEMPO CACHE] Mapped shared snapshot v{snap.version} ({len(snap):,} rows).")
+                except Exception as e:
+                    print(f"[TEMPO CACHE] Error mapping shared snapshot: {e}")
+                self.next_refresh_at = datetime.utcnow() + timedelta(seconds=TEMPO_SHARED_POLL_S)
+                time.sleep(TEMPO_SHARED_POLL_S)
+                continue
+
+            delay = CACHE_TTL.total_seconds()
             try:
+                if self.snapshot is None:
+                    try:
+                        self._warm_start()
+                    except Exception as e:
+                        print(f"[TEMPO CACHE] Local copy unusable, falling back to Blob: {e}")
                 if self.needs_refresh():
                     print("[TEMPO CACHE] Refreshing cache from Azure Blob...")
-                    df = load_latest_parquet_from_blob()
-                    with self.lock:
-                        self.df = df
-                        self.last_update = datetime.utcnow()
-                    print(f"[TEMPO CACHE] Updated successfully with {len(df):,} rows.")
+                    snap = self.refresh(blocking=True)
+                    print(f"[TEMPO CACHE] Updated successfully with {len(snap):,} rows (v{snap.version}).")
                 else:
                     print("[TEMPO CACHE] Still valid; skipping refresh.")
+                    elapsed = (datetime.utcnow() - self.last_update).total_seconds()
+                    delay = max(CACHE_TTL.total_seconds() - elapsed, 1.0)
             except Exception as e:
-                print(f"[TEMPO CACHE] Error refreshing cache: {e}")
-            time.sleep(CACHE_TTL.total_seconds())
+                delay = self._retry_delay()
+                print(f"[TEMPO CACHE] Error refreshing cache: {e} (retry in {delay:.0f}s)")
+            self.next_refresh_at = datetime.utcnow() + timedelta(seconds=delay)
+            time.sleep(delay)
 
     def needs_refresh(self):
-        if self.df is None or self.last_update is None:
+        if self.snapshot is None or self.last_update is None or self._revalidate:
             return True
         return datetime.utcnow() - self.last_update > CACHE_TTL
 
+    def get_snapshot(self) -> TempoSnapshot:
+        snap = self.snapshot
+        if snap is not None:
+            return snap
+
+        if self._thread is not None:
+            # El warm-up corre en segundo plano: no bloquear requests esperándolo
+            detail = f" (último error: {self.last_error})" if self.last_error else ""
+            raise SnapshotNotReady(f"TEMPO todavía no está cargado{detail}")
+
+        # Cold start single-flight (sin hilo de refresh): el primero carga, el resto espera
+        with self._load_lock:
+            if self.snapshot is not None:
+                return self.snapshot
+            # Si la carga acaba de fallar, no reintentar en cascada desde cada request
+            if self.last_error_at and (datetime.utcnow() - self.last_error_at).total_seconds() < COLD_LOAD_ERROR_HOLD_S:
+                raise RuntimeError(f"TEMPO no disponible: {self.last_error}")
+            if self.shared is not None:
+                # Si el host ya tiene una versión publicada, se sirve esa (el refresher la revalida)
+                snap = self._adopt_shared()
+                if snap is not None:
+                    return snap
+            print("[TEMPO CACHE] Cache empty, loading for first time...")
+            return self._load()
+
     def get_df(self):
-        with self.lock:
-            if self.df is not None:
-                return self.df
+        return self.get_snapshot().df
 
-        print("[TEMPO CACHE] Cache empty, loading for first time...")
-        df = load_latest_parquet_from_blob()
-        with self.lock:
-            self.df = df
-            self.last_update = datetime.utcnow()
-        return df
+    def status(self) -> dict:
+        snap = self.snapshot
+        return {
+            "version": snap.version if snap is not None else None,
+            "rows": len(snap) if snap is not None else 0,
+            "loaded_at": snap.loaded_at.isoformat() if snap is not None else None,
+            "age_seconds": self.age_seconds,
+            "ready": self.ready,
+            "refreshing": self.refreshing,
+            "consecutive_failures": self.consecutive_failures,
+            "last_error": self.last_error,
+            "last_error_at": self.last_error_at.isoformat() if self.last_error_at else None,
+            "next_refresh_at": self.next_refresh_at.isoformat() if self.next_refresh_at else None,
+            "shared_dir": self.shared.directory if self.shared is not None else None,
+            "shared_refresher": self.shared.is_refresher if self.shared is not None else None,
+        }
 
 
 # instancia global
 tempo_cache = TempoCache()
-
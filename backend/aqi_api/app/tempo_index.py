@@ -0,0 +1,250 @@
+# app/tempo_index.py
+import math
+import os
+import numpy as np
+
+# Lado (grados) de las celdas del índice; del orden de unos pocos píxeles TEMPO
+TEMPO_INDEX_CELL_DEG = float(os.getenv("TEMPO_INDEX_CELL_DEG", "0.1"))
+# Candidatos por tanda al recorrer ventanas grandes (acota la memoria por consulta)
+SCAN_CHUNK = 4_000_000
+
+
+class TempoIndex:
+    """
+    Índice espacial de grilla sobre los píxeles lat/lon de un snapshot TEMPO.
+
+    Todo el índice son dos arrays planos (sin objetos por proceso):
+    - `order`: posiciones de los píxeles ordenadas por celda;
+    - `offsets`: inicio de cada celda dentro de `order` (CSR, nceldas + 1).
+    Así se publica junto al snapshot compartido y cada worker lo mapea en
+    modo lectura. Es de solo lectura: se puede consultar desde varios hilos.
+
+    La búsqueda es exacta (misma métrica que antes: distancia euclidiana en
+    grados): se revisa una ventana de celdas alrededor del punto y se agranda
+    hasta que ningún píxel fuera de ella pueda estar más cerca que el mejor encontrado.
+    """
+
+    def __init__(self, lat, lon, order, offsets, lat0: float, lon0: float, cell: float, nlat: int, nlon: int):
+        self.lat = lat
+        self.lon = lon
+        self.order = order
+        self.offsets = offsets
+        self.lat0 = lat0
+        self.lon0 = lon0
+        self.cell = cell
+        self.nlat = nlat
+        self.nlon = nlon
+        self.size = len(lat)
+
+    @classmethod
+    def build(cls, lat, lon, cell: float = TEMPO_INDEX_CELL_DEG):
+        """Construye el índice (un solo argsort por clave de celda)."""
+        lat64 = np.asarray(lat, dtype=np.float64)
+        lon64 = np.asarray(lon, dtype=np.float64)
+        valid = np.isfinite(lat64) & np.isfinite(lon64)
+        if valid.any():
+            lat0 = math.floor(lat64[valid].min() / cell) * cell
+            lon0 = math.floor(lon64[valid].min() / cell) * cell
+            nlat = int((lat64[valid].max() - lat0) // cell) + 1
+            nlon = int((lon64[valid].max() - lon0) // cell) + 1
+        else:
+            lat0 = lon0 = 0.0
+            nlat = nlon = 1
+
+        rows = np.flatnonzero(valid)
+        key = (
+            np.minimum(((lat64[rows] - lat0) // cell).astype(np.int64), nlat - 1) * nlon
+            + np.minimum(((lon64[rows] - lon0) // cell).astype(np.int64), nlon - 1)
+        )
+        sort = np.argsort(key, kind="stable")
+        pos_dtype = np.int32 if len(lat64) < 2 ** 31 else np.int64
+        order = rows[sort].astype(pos_dtype)
+        offsets = np.searchsorted(key[sort], np.arange(nlat * nlon + 1)).astype(np.int64)
+        return cls(lat, lon, order, offsets, lat0, lon0, cell, nlat, nlon)
+
+    # --- persistencia (store compartido) ---
+    @property
+    def arrays(self) -> dict:
+        return {"order": self.order, "offsets": self.offsets}
+
+    @property
+    def meta(self) -> dict:
+        return {"lat0": self.lat0, "lon0": self.lon0, "cell": self.cell, "nlat": self.nlat, "nlon": self.nlon}
+
+    @classmethod
+    def from_arrays(cls, lat, lon, arrays: dict, meta: dict):
+        return cls(lat, lon, arrays["order"], arrays["offsets"], **meta)
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.order.nbytes + self.offsets.nbytes)
+
+    # --- consultas ---
+    def nearest(self, lat: float, lon: float, max_dist: float = np.inf):
+        """
+        Devuelve (distancia_en_grados, posición) del píxel más cercano,
+        o (inf, None) si no hay ninguno dentro de `max_dist`.
+
+        Camino escalar (sin los arrays auxiliares de `nearest_many`): revisa el
+        bloque 3x3 de celdas alrededor del punto, fila por fila como slices de
+        `order`, y agranda la ventana solo si hace falta.
+        """
+        if self.size == 0 or not (math.isfinite(lat) and math.isfinite(lon)):
+            return float("inf"), None
+
+        ci = math.floor((lat - self.lat0) / self.cell)
+        cj = math.floor((lon - self.lon0) / self.cell)
+        gap = max(-ci, ci - (self.nlat - 1), -cj, cj - (self.nlon - 1), 0)
+        max_ring = max(self.nlat, self.nlon) + gap
+
+        best_d2, best_pos = math.inf, -1
+        r = gap + 1
+        while True:
+            i0, i1 = max(ci - r, 0), min(ci + r, self.nlat - 1)
+            j0, j1 = max(cj - r, 0), min(cj + r, self.nlon - 1)
+            rows = [
+                self.order[self.offsets[i * self.nlon + j0]:self.offsets[i * self.nlon + j1 + 1]]
+                for i in range(i0, i1 + 1)
+            ]
+            cand = np.concatenate(rows) if rows else self.order[:0]
+            if len(cand):
+                d2 = (np.asarray(self.lat[cand], dtype=np.float64) - lat) ** 2 \
+                    + (np.asarray(self.lon[cand], dtype=np.float64) - lon) ** 2
+                k = int(np.argmin(d2))
+                if d2[k] < best_d2:
+                    best_d2, best_pos = float(d2[k]), int(cand[k])
+
+            # Mismo criterio de corte que `nearest_many`
+            reach = r * self.cell
+            if best_d2 <= reach ** 2 or reach > max_dist or r > max_ring:
+                break
+            if math.isfinite(best_d2):
+                r = max(int(math.sqrt(best_d2) // self.cell) + 1, r + 1)
+            else:
+                r *= 2
+            r = min(r, max_ring + 1)
+
+        dist = math.sqrt(best_d2)
+        if best_pos < 0 or dist > max_dist:
+            return float("inf"), None
+        return dist, best_pos
+
+    def nearest_many(self, lats, lons, max_dist: float = np.inf):
+        """
+        Versión vectorizada de `nearest` para arrays de coordenadas.
+        Las posiciones sin vecino dentro de `max_dist` (o con coordenadas no
+        finitas) quedan en -1 (distancia inf).
+        """
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        n = len(lats)
+        best_d2 = np.full(n, np.inf)
+        best_pos = np.full(n, -1, dtype=np.int64)
+        if n == 0 or self.size == 0:
+            return np.sqrt(best_d2), best_pos
+
+        finite = np.isfinite(lats) & np.isfinite(lons)
+        with np.errstate(invalid="ignore"):
+            ci = np.floor((np.where(finite, lats, self.lat0) - self.lat0) / self.cell).astype(np.int64)
+            cj = np.floor((np.where(finite, lons, self.lon0) - self.lon0) / self.cell).astype(np.int64)
+        # Distancia (en celdas) desde la celda del punto hasta la grilla: puntos fuera
+        # arrancan en el primer anillo que la toca
+        gap = np.maximum(
+            np.maximum(np.maximum(-ci, ci - (self.nlat - 1)), 0),
+            np.maximum(np.maximum(-cj, cj - (self.nlon - 1)), 0),
+        )
+        max_ring = int(max(self.nlat, self.nlon) + gap.max())
+
+        # Primero el bloque 3x3 alrededor de cada punto (todos a la vez); la ventana
+        # se agranda solo para los que todavía no tienen vecino garantizado
+        pending = np.flatnonzero(finite)
+        radius = gap + 1
+        while len(pending):
+            r = radius[pending]
+            self._scan_window(
+                lats, lons, pending,
+                np.clip(ci[pending] - r, 0, self.nlat - 1), np.clip(ci[pending] + r, 0, self.nlat - 1),
+                np.clip(cj[pending] - r, 0, self.nlon - 1), np.clip(cj[pending] + r, 0, self.nlon - 1),
+                best_d2, best_pos,
+            )
+            # Todo píxel fuera de la ventana está al menos a `r` celdas de distancia
+            reach = r * self.cell
+            done = (best_d2[pending] <= reach ** 2) | (reach > max_dist) | (r > max_ring)
+            pending = pending[~done]
+            # Con un candidato a distancia d basta una ventana de d/cell + 1 celdas
+            # (una pasada más); sin candidato, se duplica
+            with np.errstate(invalid="ignore"):
+                found = np.sqrt(best_d2[pending]) // self.cell + 1
+            grow = np.where(np.isfinite(found), np.maximum(found, radius[pending] + 1), radius[pending] * 2)
+            radius[pending] = np.minimum(grow, max_ring + 1).astype(np.int64)
+
+        dist = np.sqrt(best_d2)
+        miss = dist > max_dist
+        dist[miss] = np.inf
+        best_pos[miss] = -1
+        return dist, best_pos
+
+    def rows_in_bbox(self, lat_min: float, lon_min: float, lat_max: float, lon_max: float):
+        """
+        Posiciones de los píxeles de las celdas que tocan el bbox (superconjunto:
+        incluye el resto de las celdas del borde). Sin recorrer todo el snapshot.
+        """
+        i0 = max(math.floor((lat_min - self.lat0) / self.cell), 0)
+        i1 = min(math.floor((lat_max - self.lat0) / self.cell), self.nlat - 1)
+        j0 = max(math.floor((lon_min - self.lon0) / self.cell), 0)
+        j1 = min(math.floor((lon_max - self.lon0) / self.cell), self.nlon - 1)
+        if self.size == 0 or i0 > i1 or j0 > j1:
+            return self.order[:0]
+        return np.concatenate([
+            self.order[self.offsets[i * self.nlon + j0]:self.offsets[i * self.nlon + j1 + 1]]
+            for i in range(i0, i1 + 1)
+        ])
+
+    def _scan_window(self, lats, lons, pts, i0, i1, j0, j1, best_d2, best_pos):
+        """
+        Revisa, para cada punto de `pts`, los píxeles de su ventana de celdas
+        [i0..i1] x [j0..j1] y actualiza el mejor vecino. Cada fila de la ventana
+        es un rango contiguo de `order`; se procesa por tandas de tamaño acotado.
+        """
+        # Una entrada por (punto, fila de la ventana)
+        nrows = i1 - i0 + 1
+        row_pt = np.repeat(np.arange(len(pts)), nrows)
+        row_i = np.repeat(i0 - (np.cumsum(nrows) - nrows), nrows) + np.arange(int(nrows.sum()))
+        start = self.offsets[row_i * self.nlon + j0[row_pt]]
+        count = self.offsets[row_i * self.nlon + j1[row_pt] + 1] - start
+        has = count > 0
+        row_pt, start, count = row_pt[has], start[has], count[has]
+        if not len(count):
+            return
+
+        # Tandas de ~SCAN_CHUNK candidatos (cortando siempre entre puntos distintos)
+        cum = np.cumsum(count)
+        bounds = [0]
+        while bounds[-1] < len(count):
+            lo = bounds[-1]
+            hi = int(np.searchsorted(cum, (cum[lo - 1] if lo else 0) + SCAN_CHUNK, side="right"))
+            hi = max(hi, lo + 1)
+            while hi < len(count) and row_pt[hi] == row_pt[hi - 1]:
+                hi += 1
+            bounds.append(hi)
+        for lo, hi in zip(bounds[:-1], bounds[1:]):
+            self._scan_ranges(lats, lons, pts[row_pt[lo:hi]], start[lo:hi], count[lo:hi], best_d2, best_pos)
+
+    def _scan_ranges(self, lats, lons, range_pt, start, count, best_d2, best_pos):
+        total = int(count.sum())
+        first = np.cumsum(count) - count
+        rows = self.order[np.arange(total) - np.repeat(first - start, count)]
+        pt = np.repeat(range_pt, count)
+
+        d2 = (np.asarray(self.lat[rows], dtype=np.float64) - lats[pt]) ** 2 \
+            + (np.asarray(self.lon[rows], dtype=np.float64) - lons[pt]) ** 2
+
+        # Mínimo por punto (los candidatos de cada punto son contiguos)
+        starts = np.flatnonzero(np.r_[True, pt[1:] != pt[:-1]])
+        group = np.repeat(np.arange(len(starts)), np.diff(np.r_[starts, len(pt)]))
+        hit = np.flatnonzero(d2 == np.minimum.reduceat(d2, starts)[group])
+        hit = hit[np.r_[True, group[hit][1:] != group[hit][:-1]]]
+        pt, d2, rows = pt[hit], d2[hit], rows[hit]
+        better = d2 < best_d2[pt]
+        best_d2[pt[better]] = d2[better]
+        best_pos[pt[better]] = rows[better]
@@ -0,0 +1,104 @@
+# app/tempo_raster.py
+import math
+import numpy as np
+
+from app.core import compute_tempo_aqi_arrays
+
+TEMPO_PRODUCTS = ("no2", "o3tot", "o3prof", "hcho")
+
+
+class TempoRaster:
+    """
+    Snapshot TEMPO remuestreado a una grilla regular lat/lon.
+
+    Cada producto es un array float32 denso y contiguo de forma (nlat, nlon);
+    la fila 0 es la latitud mínima. Un punto se resuelve con aritmética de
+    índices y una región es un slice (vista, sin copia).
+    """
+
+    def __init__(self, lat0: float, lon0: float, res: float, layers: dict):
+        self.lat0 = lat0
+        self.lon0 = lon0
+        self.res = res
+        self.layers = layers
+        self.nlat, self.nlon = next(iter(layers.values())).shape
+
+    @classmethod
+    def from_columns(cls, columns: dict, res: float, bbox=None):
+        """
+        Construye la grilla promediando los píxeles de cada celda (bincount vectorizado).
+        `bbox` = (minLon, minLat, maxLon, maxLat); por defecto, la extensión de los datos.
+        """
+        lat = np.asarray(columns["lat"], dtype=np.float64)
+        lon = np.asarray(columns["lon"], dtype=np.float64)
+
+        if bbox is None:
+            bbox = (np.nanmin(lon), np.nanmin(lat), np.nanmax(lon), np.nanmax(lat))
+        min_lon, min_lat, max_lon, max_lat = bbox
+        lat0 = math.floor(min_lat / res) * res
+        lon0 = math.floor(min_lon / res) * res
+        nlat = int(math.floor((max_lat - lat0) / res)) + 1
+        nlon = int(math.floor((max_lon - lon0) / res)) + 1
+
+        i = np.floor((lat - lat0) / res).astype(np.int64)
+        j = np.floor((lon - lon0) / res).astype(np.int64)
+        inside = (i >= 0) & (i < nlat) & (j >= 0) & (j < nlon)
+        flat = i * nlon + j
+        size = nlat * nlon
+
+        layers = {}
+        for name in TEMPO_PRODUCTS:
+            if name not in columns:
+                continue
+            vals = np.asarray(columns[name], dtype=np.float64)
+            ok = inside & ~np.isnan(vals)
+            counts = np.bincount(flat[ok], minlength=size)
+            sums = np.bincount(flat[ok], weights=vals[ok], minlength=size)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                layer = (sums / counts).astype(np.float32)
+            layers[name] = layer.reshape(nlat, nlon)
+
+        # AQI TEMPO sobre los valores de celda (mismo cálculo que por píxel)
+        flat_layers = {k: v.ravel() for k, v in layers.items()}
+        if flat_layers:
+            aqi, _, _ = compute_tempo_aqi_arrays(flat_layers)
+            layers["tempo_aqi_value"] = aqi.astype(np.float32).reshape(nlat, nlon)
+
+        return cls(lat0, lon0, res, layers)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(layer.nbytes for layer in self.layers.values())
+
+    def cell(self, lat: float, lon: float):
+        """Índices (i, j) de la celda que contiene el punto, o None si cae fuera."""
+        i = int((lat - self.lat0) // self.res)
+        j = int((lon - self.lon0) // self.res)
+        if 0 <= i < self.nlat and 0 <= j < self.nlon:
+            return i, j
+        return None
+
+    def cell_center(self, i: int, j: int):
+        return self.lat0 + (i + 0.5) * self.res, self.lon0 + (j + 0.5) * self.res
+
+    def point(self, lat: float, lon: float):
+        """Valores de todas las capas en la celda del punto (dict), o None si cae fuera."""
+        ij = self.cell(lat, lon)
+        if ij is None:
+            return None
+        i, j = ij
+        return {name: float(layer[i, j]) for name, layer in self.layers.items()}
+
+    def window(self, min_lat: float, min_lon: float, max_lat: float, max_lon: float):
+        """Índices (i0, i1, j0, j1) de la ventana de celdas que cubre la caja (recortada a la grilla)."""
+        i0 = max(int((min_lat - self.lat0) // self.res), 0)
+        j0 = max(int((min_lon - self.lon0) // self.res), 0)
+        i1 = min(int((max_lat - self.lat0) // self.res) + 1, self.nlat)
+        j1 = min(int((max_lon - self.lon0) // self.res) + 1, self.nlon)
+        return i0, max(i1, i0), j0, max(j1, j0)
+
+    def region(self, min_lat: float, min_lon: float, max_lat: float, max_lon: float):
+        """Vistas (sin copia) de cada capa para una caja lat/lon, más el origen de la ventana."""
+        i0, i1, j0, j1 = self.window(min_lat, min_lon, max_lat, max_lon)
+        lat0, lon0 = self.lat0 + i0 * self.res, self.lon0 + j0 * self.res
+        return (lat0, lon0), {name: layer[i0:i1, j0:j1] for name, layer in self.layers.items()}
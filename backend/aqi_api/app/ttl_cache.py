@@ -0,0 +1,103 @@
+# app/ttl_cache.py
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+
+MISSING = object()
+
+
+class TTLCache:
+    """
+    Cache LRU acotada en cantidad de entradas, con expiración opcional por TTL.
+    Thread-safe; guarda contadores de hits/misses.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=MISSING):
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                value, expires = item
+                if expires is None or expires > now:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl: float = MISSING):
+        ttl = self.ttl if ttl is MISSING else ttl
+        expires = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            item = self._data.pop(key, None)
+        return item[0] if item is not None else default
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class SingleFlightCache(TTLCache):
+    """
+    TTLCache para loaders async con coalescing: si N requests piden la misma
+    clave mientras se está cargando, se hace una sola llamada upstream y
+    todas esperan el mismo resultado. Los errores no se cachean.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = None):
+        super().__init__(maxsize, ttl)
+        self._inflight = {}
+
+    async def get_or_load(self, key, loader, ttl_of=None):
+        """
+        `ttl_of(value)`, si se pasa, decide el TTL de lo recién cargado
+        (MISSING = el TTL por defecto, 0 = no cachear).
+        """
+        value = self.get(key)
+        if value is not MISSING:
+            return value
+
+        future = self._inflight.get(key)
+        if future is not None:
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await loader()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Evita "Future exception was never retrieved" si nadie más esperaba
+            future.exception()
+            raise
+        else:
+            ttl = MISSING if ttl_of is None else ttl_of(value)
+            if ttl != 0:
+                self.set(key, value, ttl)
+            future.set_result(value)
+            return value
+        finally:
+            self._inflight.pop(key, None)
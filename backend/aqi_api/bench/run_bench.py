@@ -0,0 +1,207 @@
+# bench/run_bench.py
+"""
+Microbenchmarks de las funciones core de la API AQI sobre datos sintéticos.
+
+Uso (desde backend/aqi_api):
+    python -m bench.run_bench --sizes 100000,1000000 --out bench_results.json
+    python -m bench.run_bench --compare bench_results_old.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from app.core import (
+    get_nearest_tempo_point,
+    get_nearest_pixel,
+    get_tempo_cell,
+    compute_aqi_summary,
+    compute_tempo_aqi,
+    combine_aqi_sources,
+    sanitize_json,
+)
+from app.aqi_engine import compute_aqi_summary_batch, measurements_from_stations
+from app.serialization import dumps
+from app.tempo_cache import TempoSnapshot
+from bench.synthetic import make_tempo_snapshot, make_station_with_measurements, random_points
+
+
+def measure(fn, min_time: float = 0.5, max_calls: int = 200_000, warmup: int = 3) -> dict:
+    """Latencia por llamada (mediana/p95), throughput y pico de memoria de una llamada."""
+    for _ in range(warmup):
+        fn()
+
+    timings = []
+    deadline = time.perf_counter() + min_time
+    while len(timings) < max_calls and (time.perf_counter() < deadline or len(timings) < 5):
+        t0 = time.perf_counter_ns()
+        fn()
+        timings.append(time.perf_counter_ns() - t0)
+
+    # Pico de memoria en una pasada aparte, para no contaminar los tiempos
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    arr = np.array(timings, dtype=np.float64) / 1e3
+    return {
+        "calls": len(timings),
+        "median_us": round(float(np.median(arr)), 3),
+        "p95_us": round(float(np.percentile(arr, 95)), 3),
+        "ops_per_s": round(1e6 / float(arr.mean()), 1),
+        "peak_kib": round(peak / 1024, 1),
+    }
+
+
+def cycling(values):
+    """Devuelve una función que entrega el siguiente elemento en cada llamada (en ciclo)."""
+    state = {"i": 0}
+
+    def next_value():
+        i = state["i"]
+        state["i"] = (i + 1) % len(values)
+        return values[i]
+
+    return next_value
+
+
+def snapshot_benchmarks(n_pixels: int, min_time: float):
+    results = []
+    df = make_tempo_snapshot(n_pixels)
+
+    t0 = time.perf_counter()
+    tracemalloc.start()
+    snapshot = TempoSnapshot(df.copy(), version=1)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    results.append({
+        "name": "snapshot_build", "calls": 1,
+        "median_us": round((time.perf_counter() - t0) * 1e6, 1),
+        "p95_us": None, "ops_per_s": None, "peak_kib": round(peak / 1024, 1),
+    })
+
+    lats, lons = random_points(10_000)
+    point = cycling(list(zip(lats.tolist(), lons.tolist())))
+
+    cases = {
+        "get_nearest_tempo_point": lambda: get_nearest_tempo_point(snapshot, *point()),
+        "get_nearest_pixel": lambda: get_nearest_pixel(snapshot, *point()),
+    }
+    if snapshot.raster is not None:
+        cases["get_tempo_cell"] = lambda: get_tempo_cell(snapshot, *point())
+    cases["nearest_many_10k"] = lambda: snapshot.index.nearest_many(lats, lons)
+
+    for name, fn in cases.items():
+        results.append({"name": name, **measure(fn, min_time=min_time)})
+    for r in results:
+        r["size"] = n_pixels
+    return results
+
+
+def scalar_benchmarks(min_time: float):
+    station = make_station_with_measurements()
+    tempo_raw = {"no2": 4.2e15, "o3tot": 310.5, "o3prof": 7.1, "hcho": 9.3e15}
+    tempo_row = {
+        **tempo_raw,
+        "nearest_lat": 40.7, "nearest_lon": -74.0, "distance_deg": 0.01,
+        "tempo_aqi_value": 55.2, "tempo_aqi_category": "Moderada",
+        "aqi_no2": 42.0, "aqi_o3tot": 103.5, "aqi_hcho": 46.5,
+    }
+    response = {
+        "coordinates": {"lat": 40.7, "lon": -74.0},
+        "station": {"id": 1, "name": "Station 1", "distance_km": 3.2},
+        "aqi": combine_aqi_sources(station, tempo_raw),
+        "latest_measurements": station["latest_measurements"],
+        "tempo_data": {**tempo_row, "o3prof": float("nan")},
+    }
+
+    stations = [make_station_with_measurements(i, seed=i) for i in range(10_000)]
+    columns = measurements_from_stations(stations)
+    index = [s["id"] for s in stations]
+
+    cases = {
+        "compute_aqi_summary": lambda: compute_aqi_summary(station),
+        "compute_tempo_aqi": lambda: compute_tempo_aqi(tempo_raw),
+        "compute_tempo_aqi_precomputed": lambda: compute_tempo_aqi(tempo_row),
+        "combine_aqi_sources": lambda: combine_aqi_sources(station, tempo_raw),
+        "sanitize_json": lambda: sanitize_json(response),
+        "serialization_dumps": lambda: dumps(response),
+        "compute_aqi_summary_batch_10k": lambda: compute_aqi_summary_batch(*columns, index=index),
+    }
+    return [{"name": name, "size": None, **measure(fn, min_time=min_time)} for name, fn in cases.items()]
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except Exception:
+        return None
+
+
+def compare(current: dict, baseline_path: str):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    old = {(r["name"], r["size"]): r for r in baseline["results"]}
+    print(f"\nComparación contra {baseline_path} ({baseline['meta'].get('commit')}):")
+    print(f"{'benchmark':38s} {'size':>10s} {'old µs':>12s} {'new µs':>12s} {'ratio':>8s}")
+    for r in current["results"]:
+        o = old.get((r["name"], r["size"]))
+        if not o or not o["median_us"]:
+            continue
+        ratio = r["median_us"] / o["median_us"]
+        print(f"{r['name']:38s} {str(r['size'] or '-'):>10s} {o['median_us']:12.2f} {r['median_us']:12.2f} {ratio:8.2f}x")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="100000,1000000",
+                        help="Tamaños de snapshot (píxeles) separados por coma, p.ej. 100000,1000000,10000000")
+    parser.add_argument("--min-time", type=float, default=0.5, help="Segundos mínimos de medición por benchmark")
+    parser.add_argument("--out", default="bench_results.json", help="Archivo JSON de salida")
+    parser.add_argument("--compare", help="JSON de una corrida anterior para comparar")
+    args = parser.parse_args(argv)
+
+    results = scalar_benchmarks(args.min_time)
+    for size in (int(s) for s in args.sizes.split(",") if s):
+        print(f"[BENCH] Snapshot sintético de {size:,} píxeles...")
+        results.extend(snapshot_benchmarks(size, args.min_time))
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": sys.version.split()[0],
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "results": results,
+    }
+
+    print(f"\n{'benchmark':38s} {'size':>10s} {'median µs':>12s} {'p95 µs':>12s} {'ops/s':>12s} {'peak KiB':>10s}")
+    for r in results:
+        print(
+            f"{r['name']:38s} {str(r['size'] or '-'):>10s} {r['median_us']:12.2f} "
+            f"{(r['p95_us'] or 0):12.2f} {(r['ops_per_s'] or 0):12.1f} {r['peak_kib']:10.1f}"
+        )
+
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\n[BENCH] Resultados guardados en {args.out}")
+
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == "__main__":
+    main()
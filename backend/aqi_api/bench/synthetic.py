@@ -0,0 +1,111 @@
+# bench/synthetic.py
+import numpy as np
+import pandas as pd
+
+# Extensión aproximada del campo de visión de TEMPO (Norteamérica)
+TEMPO_LAT_RANGE = (17.0, 63.0)
+TEMPO_LON_RANGE = (-140.0, -50.0)
+
+# Fracción de píxeles sin dato (flags de calidad, nubes) por producto
+NAN_FRACTIONS = {"no2": 0.35, "o3tot": 0.15, "o3prof": 0.5, "hcho": 0.45}
+
+
+def make_tempo_snapshot(n_pixels: int, seed: int = 0, nan_fractions=None) -> pd.DataFrame:
+    """
+    Snapshot TEMPO sintético con la misma forma que el parquet real:
+    lat/lon sobre una grilla de escaneo curva (scanlines × ground pixels,
+    con leve rotación y ruido) y las columnas no2/o3tot/o3prof/hcho con NaNs.
+    """
+    rng = np.random.default_rng(seed)
+    nan_fractions = NAN_FRACTIONS if nan_fractions is None else nan_fractions
+
+    # TEMPO: ~2k ground pixels N-S por scanline; el resto son scanlines E-O
+    n_ground = int(min(2048, max(64, np.sqrt(n_pixels / 2))))
+    n_scan = int(np.ceil(n_pixels / n_ground))
+    u = (np.arange(n_scan) + 0.5) / n_scan
+    v = (np.arange(n_ground) + 0.5) / n_ground
+    uu, vv = np.meshgrid(u, v, indexing="ij")
+
+    lat0, lat1 = TEMPO_LAT_RANGE
+    lon0, lon1 = TEMPO_LON_RANGE
+    lat = lat0 + vv * (lat1 - lat0) + 1.5 * np.sin(np.pi * uu)
+    lon = lon0 + uu * (lon1 - lon0) + 3.0 * (vv - 0.5) * (uu - 0.5)
+    lat = lat.ravel()[:n_pixels] + rng.normal(0, 0.005, n_pixels)
+    lon = lon.ravel()[:n_pixels] + rng.normal(0, 0.005, n_pixels)
+
+    df = pd.DataFrame({
+        "lat": lat.astype(np.float32),
+        "lon": lon.astype(np.float32),
+        "no2": rng.lognormal(np.log(3e15), 0.8, n_pixels).astype(np.float32),
+        "o3tot": rng.normal(300, 40, n_pixels).astype(np.float32),
+        "o3prof": rng.gamma(4.0, 2.0, n_pixels).astype(np.float32),
+        "hcho": rng.lognormal(np.log(8e15), 0.6, n_pixels).astype(np.float32),
+    })
+    for col, frac in nan_fractions.items():
+        mask = rng.random(n_pixels) < frac
+        df.loc[mask, col] = np.nan
+    return df
+
+
+def random_points(n: int, seed: int = 1):
+    """Puntos de consulta uniformes dentro del campo de visión."""
+    rng = np.random.default_rng(seed)
+    return rng.uniform(*TEMPO_LAT_RANGE, n), rng.uniform(*TEMPO_LON_RANGE, n)
+
+
+# --- Payloads OpenAQ v3 enlatados ---
+
+_SENSORS = [
+    (1, "PM2.5", "µg/m³"),
+    (2, "PM10", "µg/m³"),
+    (3, "O₃", "ppm"),
+    (4, "CO", "ppm"),
+    (5, "NO₂", "ppm"),
+    (6, "SO₂", "ppm"),
+]
+
+
+def make_station(station_id: int = 1, lat: float = 40.71, lon: float = -74.0) -> dict:
+    """Entrada de /v3/locations con todos los sensores habituales."""
+    return {
+        "id": station_id,
+        "name": f"Station {station_id}",
+        "coordinates": {"latitude": lat, "longitude": lon},
+        "distance_km": 3.2,
+        "sensors": [
+            {"id": station_id * 10 + sid, "name": name, "parameter": {"displayName": name, "units": units}}
+            for sid, name, units in _SENSORS
+        ],
+    }
+
+
+def make_latest_payload(station: dict, seed: int = 0) -> dict:
+    """Respuesta de /v3/locations/{id}/latest para `station`."""
+    rng = np.random.default_rng(seed)
+    typical = {"PM2.5": 15.0, "PM10": 40.0, "O₃": 0.045, "CO": 0.6, "NO₂": 0.02, "SO₂": 0.003}
+    return {
+        "results": [
+            {
+                "sensorsId": s["id"],
+                "value": float(typical[s["name"]] * rng.uniform(0.5, 2.0)),
+                "datetime": {"utc": "2024-06-01T12:00:00Z", "local": "2024-06-01T08:00:00-04:00"},
+            }
+            for s in station["sensors"]
+        ]
+    }
+
+
+def make_station_with_measurements(station_id: int = 1, seed: int = 0) -> dict:
+    """Estación con `latest_measurements` ya adjuntas (entrada de compute_aqi_summary)."""
+    station = make_station(station_id)
+    values = {item["sensorsId"]: item["value"] for item in make_latest_payload(station, seed)["results"]}
+    station["latest_measurements"] = [
+        {
+            "parameter": s["parameter"]["displayName"],
+            "value": values[s["id"]],
+            "units": s["parameter"]["units"],
+            "datetime": "2024-06-01T08:00:00-04:00",
+        }
+        for s in station["sensors"]
+    ]
+    return station
@@ -1,8 +1,10 @@
 import boto3
 import json
+import os
 import re
 import logging
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 
 # --- Configurar logger global con soporte UTF-8 ---
@@ -16,77 +18,128 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Productos se buscan en paralelo (cada uno lista sus propios prefijos diarios)
+TEMPO_DISCOVERY_WORKERS = int(os.getenv("TEMPO_DISCOVERY_WORKERS", "4"))
 
-def get_latest_tempo_file_for_region(
+# Granule TEMPO L2: ..._S<scan><región>.nc / .nc4 (región G01–G09)
+GRANULE_KEY_RE = re.compile(r"_S\d{3}(G\d{2})\.(?:NC|NC4)$", re.IGNORECASE)
+
+
+def list_prefix(s3, bucket, prefix):
+    """Lista todos los objetos de un prefijo, siguiendo la paginación (IsTruncated)."""
+    objects = []
+    for page in s3.get_paginator("list_objects_v2").paginate(Bucket=bucket, Prefix=prefix):
+        objects.extend(page.get("Contents", []))
+    return objects
+
+
+def search_days(target_dt, hours_step=3, max_days=5):
+    """
+    Días (más reciente primero) que cubre la búsqueda hacia atrás en pasos de
+    `hours_step` horas durante `max_days` días; cada día aparece una sola vez.
+    """
+    max_iter = int((24 / hours_step) * max_days)
+    days = []
+    for i in range(max_iter):
+        day = (target_dt - timedelta(hours=hours_step * i)).strftime("%Y.%m.%d")
+        if not days or days[-1] != day:
+            days.append(day)
+    return days
+
+
+def get_latest_tempo_files_for_product(
     s3,
     bucket,
     target_dt,
-    region,
+    regions,
     prefix,
     hours_step=3,
     max_days=5
 ):
     """
-    Busca el archivo TEMPO más reciente dentro de intervalos de `hours_step` horas hacia atrás,
-    con un límite total de `max_days` días (por defecto, 5 días = 40 iteraciones).
+    Busca el archivo TEMPO más reciente de cada región para un producto.
 
-    - Recorre cada bloque de 3 horas hacia atrás (por defecto).
-    - Dentro de cada bloque, busca archivos NetCDF (.nc / .nc4) correspondientes a la región (G01–G09).
-    - Devuelve el más reciente que exista dentro de cualquier bloque del rango de 5 días.
+    - Lista cada prefijo diario una sola vez (con paginación completa) y
+      resuelve todas las regiones desde ese mismo listado.
+    - Para cada región, devuelve el archivo más reciente del día más nuevo
+      que tenga archivos suyos (mismo criterio que la búsqueda por región).
+    - Corta apenas todas las regiones tienen archivo.
 
-    Si no se encuentra nada, devuelve {"Key": None, "LastModified": None}.
+    Devuelve {región: {"Key", "LastModified"}}, con None en las que no se encontró nada.
     """
+    pending = {r.upper(): r for r in regions}
+    found = {r: {"Key": None, "LastModified": None} for r in regions}
+    days = search_days(target_dt, hours_step, max_days)
 
-    max_iter = int((24 / hours_step) * max_days)
-    search_dt = target_dt
-
-    for i in range(max_iter):
-        date_prefix = search_dt.strftime("%Y.%m.%d")
-        prefix_full = f"{prefix}/{date_prefix}/"
-
+    for i, day in enumerate(days):
+        prefix_full = f"{prefix}/{day}/"
         logger.info(
-            f"🔎 [{i+1:02d}/{max_iter}] Buscando archivos en: {prefix_full} "
-            f"para región {region} ({search_dt:%Y-%m-%d %H:%M UTC})"
+            f"🔎 [{i+1:02d}/{len(days)}] Listando {prefix_full} "
+            f"({len(pending)} regiones pendientes)"
         )
 
         try:
-            resp = s3.list_objects_v2(Bucket=bucket, Prefix=prefix_full)
+            objects = list_prefix(s3, bucket, prefix_full)
         except Exception as e:
             logger.warning(f"⚠️ Error al acceder al bucket: {e}")
-            return {"Key": None, "LastModified": None}
-
-        if "Contents" in resp:
-            # Filtrar archivos válidos
-            def is_valid_nc(key: str, region: str) -> bool:
-                pattern = re.compile(rf"_S\d{{3}}{region.upper()}\.(?:NC|NC4)$", re.IGNORECASE)
-                return bool(pattern.search(key))
-
-            files = [obj for obj in resp["Contents"] if is_valid_nc(obj["Key"], region)]
-
-            if files:
-                latest = max(files, key=lambda x: x["LastModified"])
-                key = latest["Key"]
-                mod_time = latest["LastModified"]
-                logger.info(f"✅ Archivo encontrado ({mod_time}): {key}")
-                return {
-                    "Key": key,
-                    "LastModified": mod_time.isoformat() if hasattr(mod_time, "isoformat") else mod_time
-                }
-
-        # Si no hay archivos, retrocede
-        search_dt -= timedelta(hours=hours_step)
-
-    logger.error(
-        f"❌ No se encontraron archivos válidos en las últimas {max_days} días "
-        f"(pasos de {hours_step} h) para región {region}."
+            return found
+
+        latest_by_region = {}
+        for obj in objects:
+            m = GRANULE_KEY_RE.search(obj["Key"])
+            if not m:
+                continue
+            region = m.group(1).upper()
+            if region in pending:
+                best = latest_by_region.get(region)
+                if best is None or obj["LastModified"] > best["LastModified"]:
+                    latest_by_region[region] = obj
+
+        for region_upper, obj in latest_by_region.items():
+            mod_time = obj["LastModified"]
+            logger.info(f"✅ Archivo encontrado ({mod_time}): {obj['Key']}")
+            found[pending.pop(region_upper)] = {
+                "Key": obj["Key"],
+                "LastModified": mod_time.isoformat() if hasattr(mod_time, "isoformat") else mod_time
+            }
+
+        if not pending:
+            return found
+
+    for region in pending.values():
+        logger.error(
+            f"❌ No se encontraron archivos válidos en las últimas {max_days} días "
+            f"(pasos de {hours_step} h) para región {region}."
+        )
+    return found
+
+
+def get_latest_tempo_file_for_region(
+    s3,
+    bucket,
+    target_dt,
+    region,
+    prefix,
+    hours_step=3,
+    max_days=5
+):
+    """
+    Busca el archivo TEMPO más reciente de una sola región
+    (ver `get_latest_tempo_files_for_product`).
+
+    Si no se encuentra nada, devuelve {"Key": None, "LastModified": None}.
+    """
+    found = get_latest_tempo_files_for_product(
+        s3, bucket, target_dt, [region], prefix, hours_step=hours_step, max_days=max_days
     )
-    return {"Key": None, "LastModified": None}
+    return found[region]
 
 
 def get_latest_tempo_key_products(creds, target_dt=None):
     """
     Devuelve los archivos más recientes por producto y región
     utilizando credenciales temporales de NASA S3.
+    Los productos se buscan en paralelo; cada uno lista sus días una sola vez.
     """
     if target_dt is None:
         target_dt = datetime.now(timezone.utc)
@@ -108,17 +161,23 @@ def get_latest_tempo_key_products(creds, target_dt=None):
     }
 
     logger.info("🚀 Iniciando búsqueda de productos TEMPO más recientes en S3...")
-    results = []
 
-    for prod_name, prefix in products.items():
-        logger.info(f"📂 Producto: {prod_name}")
+    # El cliente boto3 es thread-safe: se comparte entre los hilos
+    with ThreadPoolExecutor(max_workers=max(1, TEMPO_DISCOVERY_WORKERS)) as pool:
+        futures = {
+            prod_name: pool.submit(get_latest_tempo_files_for_product, s3, bucket, target_dt, regions, prefix)
+            for prod_name, prefix in products.items()
+        }
+
+    results = []
+    for prod_name, future in futures.items():
+        found = future.result()
         for region in regions:
-            res = get_latest_tempo_file_for_region(s3, bucket, target_dt, region, prefix)
             results.append({
                 "product": prod_name,
                 "region": region,
-                "Key": res["Key"],
-                "LastModified": res["LastModified"]
+                "Key": found[region]["Key"],
+                "LastModified": found[region]["LastModified"]
             })
 
     logger.info(f"✅ Búsqueda completada. Total de registros: {len(results)}")
@@ -1,9 +1,14 @@
 from netCDF4 import Dataset
 import numpy as np
 import pandas as pd
+import pyarrow as pa
 import os
 import logging
 import sys
+import tempfile
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
 
 # --- Configurar logger global con soporte UTF-8 ---
 if hasattr(sys.stdout, "reconfigure"):
@@ -16,12 +21,59 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# --- Parsing multi-proceso ---
+# "thread" (en el proceso de la Function) o "process" (pool de procesos)
+TEMPO_PARSE_MODE = os.getenv("TEMPO_PARSE_MODE", "thread")
+TEMPO_PARSE_PROCESSES = int(os.getenv("TEMPO_PARSE_PROCESSES", str(os.cpu_count() or 1)))
+# Tope de memoria virtual por worker (MB); 0 = sin tope
+TEMPO_PARSE_WORKER_MEM_MB = int(os.getenv("TEMPO_PARSE_WORKER_MEM_MB", "0"))
+
+
+# Mantener en sincronía con `parse_bbox` de aqi_api/app/azure_blob_reader.py:
+# TEMPO_BBOX y TEMPO_PARSE_BBOX usan el mismo formato, pero los dos servicios
+# se construyen por separado y no comparten código.
+def parse_bbox(value):
+    """"minLon,minLat,maxLon,maxLat" → tupla de floats (o None si no está configurado)."""
+    if not value:
+        return None
+    min_lon, min_lat, max_lon, max_lat = (float(v) for v in value.split(","))
+    return min_lon, min_lat, max_lon, max_lat
+
+
+# --- Parsing "lean" (solo los hyperslabs necesarios, float32) ---
+TEMPO_PARSE_LEAN = os.getenv("TEMPO_PARSE_LEAN", "false").lower() == "true"
+# Área de interés: solo se leen las scanlines/columnas que la intersectan
+TEMPO_PARSE_BBOX = parse_bbox(os.getenv("TEMPO_PARSE_BBOX", ""))
+# Conservar la columna de quality flag `q` en modo lean
+TEMPO_PARSE_KEEP_Q = os.getenv("TEMPO_PARSE_KEEP_Q", "false").lower() == "true"
+
+# Niveles de ozone_profile que se promedian (troposfera)
+O3PROF_LEVELS = 10
+
+# Variable principal y quality flag de cada producto: (grupo, variable)
+PRODUCT_VARIABLES = {
+    "NO2": (("product", "vertical_column_troposphere"), ("product", "main_data_quality_flag")),
+    "O3TOT": (("product", "column_amount_o3"), ("support_data", "ground_pixel_quality_flag")),
+    "O3PROF": (("product", "ozone_profile"), ("qa_statistics", "exit_status")),
+    "HCHO": (("product", "vertical_column"), ("product", "main_data_quality_flag")),
+}
+
+
+def parse_signature():
+    """Identifica las opciones de parsing (la caché de granules no mezcla modos)."""
+    if not TEMPO_PARSE_LEAN:
+        return "full"
+    return f"lean;bbox={TEMPO_PARSE_BBOX};q={TEMPO_PARSE_KEEP_Q}"
+
 
 def tempo_file_to_df(local_path, product_name=None):
     """
     Abre un archivo TEMPO .nc y devuelve un DataFrame con lat/lon/valor principal.
     Incluye control de calidad por flags y reemplazo de valores inválidos.
+    Con TEMPO_PARSE_LEAN=true delega en `tempo_file_to_df_lean`.
     """
+    if TEMPO_PARSE_LEAN:
+        return tempo_file_to_df_lean(local_path, product_name)
     try:
         logger.info(f"📂 Procesando archivo: {local_path}")
         nc = Dataset(local_path, "r")
@@ -81,3 +133,172 @@ def tempo_file_to_df(local_path, product_name=None):
     except Exception as e:
         logger.error(f"⚠️ Error procesando {local_path}: {str(e)}", exc_info=True)
         return pd.DataFrame()
+
+
+def _bbox_window(lat, lon, bbox):
+    """
+    Ventana (slice de scanlines, slice de columnas) que contiene todos los
+    píxeles dentro de `bbox`, o None si el granule no la intersecta.
+    """
+    if bbox is None:
+        return slice(None), slice(None)
+    min_lon, min_lat, max_lon, max_lat = bbox
+    with np.errstate(invalid="ignore"):
+        inside = (lon >= min_lon) & (lon <= max_lon) & (lat >= min_lat) & (lat <= max_lat)
+    inside = np.ma.filled(inside, False)
+    rows = np.flatnonzero(inside.any(axis=1))
+    if rows.size == 0:
+        return None
+    cols = np.flatnonzero(inside.any(axis=0))
+    return slice(rows[0], rows[-1] + 1), slice(cols[0], cols[-1] + 1)
+
+
+def _as_float32(values):
+    """Masked array de netCDF4 → float32 con NaN en los fill values."""
+    return np.ma.filled(np.ma.asarray(values).astype(np.float32), np.nan)
+
+
+def _lean_frame(local_path, product_name, lon, lat, main, q=None):
+    data = {"lon": lon, "lat": lat, product_name.lower(): main}
+    if q is not None:
+        data["q"] = q
+    df = pd.DataFrame(data)
+    codes = np.zeros(len(df), dtype=np.int8)
+    df["source"] = pd.Categorical.from_codes(codes, categories=[os.path.basename(local_path)])
+    df["product"] = pd.Categorical.from_codes(codes, categories=[product_name])
+    return df
+
+
+def tempo_file_to_df_lean(local_path, product_name=None, bbox=None, keep_q=None):
+    """
+    Variante de bajo consumo de `tempo_file_to_df`:
+    - lee de cada variable solo el hyperslab de las scanlines/columnas que
+      intersectan `bbox` (TEMPO_PARSE_BBOX) y, en O3PROF, solo los primeros
+      `O3PROF_LEVELS` niveles del perfil;
+    - aplica flags, valores negativos, fill values y la caja en una sola máscara;
+    - devuelve lat/lon/valor en float32 y `source`/`product` como categóricas;
+      `q` solo si `keep_q` (TEMPO_PARSE_KEEP_Q).
+    """
+    bbox = TEMPO_PARSE_BBOX if bbox is None else bbox
+    keep_q = TEMPO_PARSE_KEEP_Q if keep_q is None else keep_q
+    try:
+        logger.info(f"📂 Procesando archivo (lean): {local_path}")
+        if product_name is None:
+            product_name = os.path.basename(local_path).split("_")[1]
+        product_name = product_name.upper()
+
+        group = next((k for k in PRODUCT_VARIABLES if k in product_name), None)
+        if group is None:
+            raise ValueError(f"Producto no reconocido: {product_name}")
+        (main_group, main_var), (flag_group, flag_var) = PRODUCT_VARIABLES[group]
+
+        with Dataset(local_path, "r") as nc:
+            # --- Geolocalización y ventana del área de interés ---
+            geo = nc.groups["geolocation"].variables
+            lat = geo["latitude"][:]
+            lon = geo["longitude"][:]
+            window = _bbox_window(lat, lon, bbox)
+            if window is None:
+                logger.info(f"⏭️ {os.path.basename(local_path)} fuera del área de interés.")
+                empty = np.empty(0, dtype=np.float32)
+                return _lean_frame(local_path, product_name, empty, empty, empty,
+                                   np.empty(0, dtype=np.int8) if keep_q else None)
+            rows, cols = window
+            lat = _as_float32(lat[rows, cols])
+            lon = _as_float32(lon[rows, cols])
+
+            # --- Hyperslabs de la variable principal y el flag ---
+            variable = nc.groups[main_group].variables[main_var]
+            if group == "O3PROF":
+                profile = _as_float32(variable[rows, cols, :O3PROF_LEVELS])
+                with warnings.catch_warnings():
+                    # Píxeles sin ningún nivel válido → NaN (se descartan abajo)
+                    warnings.simplefilter("ignore", RuntimeWarning)
+                    main = np.nanmean(profile, axis=2)
+                del profile
+            else:
+                main = _as_float32(variable[rows, cols])
+            flag = nc.groups[flag_group].variables[flag_var][rows, cols]
+
+        # --- Una sola máscara: flag, negativos/NaN, fill values y caja ---
+        flag_mask = np.ma.getmaskarray(flag)
+        flag = np.ma.getdata(flag)
+        with np.errstate(invalid="ignore"):
+            valid = (main >= 0) & (flag <= 1) & ~flag_mask
+            if bbox is not None:
+                min_lon, min_lat, max_lon, max_lat = bbox
+                valid &= (lon >= min_lon) & (lon <= max_lon) & (lat >= min_lat) & (lat <= max_lat)
+
+        df = _lean_frame(local_path, product_name, lon[valid], lat[valid], main[valid],
+                         flag[valid] if keep_q else None)
+        logger.info(f"✅ Archivo procesado correctamente: {os.path.basename(local_path)} ({len(df):,} filas)")
+        return df
+
+    except Exception as e:
+        logger.error(f"⚠️ Error procesando {local_path}: {str(e)}", exc_info=True)
+        return pd.DataFrame()
+
+
+def limit_worker_memory(max_mb):
+    """Initializer del pool: limita la memoria del worker (un granule enorme falla solo)."""
+    if not max_mb:
+        return
+    try:
+        import resource
+        limit = max_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    except (ImportError, ValueError, OSError) as e:
+        logger.warning(f"⚠️ No se pudo limitar la memoria del worker: {e}")
+
+
+def parse_executor(workers=None, max_mb=None):
+    """
+    Pool de procesos para parsear granules en paralelo (spawn: cada worker
+    arranca limpio, sin heredar el estado/memoria del proceso de la Function).
+    """
+    return ProcessPoolExecutor(
+        max_workers=max(1, workers or TEMPO_PARSE_PROCESSES),
+        mp_context=get_context("spawn"),
+        initializer=limit_worker_memory,
+        initargs=(TEMPO_PARSE_WORKER_MEM_MB if max_mb is None else max_mb,),
+    )
+
+
+def tempo_file_to_arrow(local_path, product_name=None, out_dir=None):
+    """
+    Variante de `tempo_file_to_df` para workers: escribe el resultado como
+    archivo Arrow IPC en `out_dir` y devuelve (ruta, filas). Así el proceso
+    padre lo mapea desde disco en lugar de recibir un DataFrame serializado
+    por pickle. Devuelve (None, 0) si el parser falló.
+    """
+    df = tempo_file_to_df(local_path, product_name)
+    if len(df.columns) == 0:
+        return None, 0
+
+    out_dir = out_dir or tempfile.gettempdir()
+    os.makedirs(out_dir, exist_ok=True)
+    path = os.path.join(out_dir, os.path.basename(local_path) + ".arrow")
+    return path, write_arrow(df, path)
+
+
+def write_arrow(df, path):
+    """Escribe un DataFrame como Arrow IPC (atómico: `.tmp` + rename). Devuelve las filas."""
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    tmp = path + ".tmp"
+    with pa.OSFile(tmp, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp, path)
+    return table.num_rows
+
+
+def read_arrow_df(path, remove=True):
+    """Carga (memory map) un archivo Arrow IPC escrito por `tempo_file_to_arrow`."""
+    if not path:
+        return pd.DataFrame()
+    with pa.memory_map(path, "r") as source:
+        df = pa.ipc.open_file(source).read_all().to_pandas()
+    if remove:
+        os.remove(path)
+    return df
+
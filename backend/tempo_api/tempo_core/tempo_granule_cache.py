@@ -0,0 +1,138 @@
+import os
+import json
+import shutil
+import tempfile
+import logging
+import sys
+from datetime import datetime, timezone
+
+import pandas as pd
+from tempo_core.tempo_file_parser import write_arrow, read_arrow_df, parse_signature
+
+# --- Configurar logger global con soporte UTF-8 ---
+if hasattr(sys.stdout, "reconfigure"):
+    sys.stdout.reconfigure(encoding="utf-8")
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    handlers=[logging.StreamHandler(sys.stdout)]
+)
+logger = logging.getLogger(__name__)
+
+# Caché de granules ya parseados entre corridas ("" la deshabilita)
+TEMPO_GRANULE_CACHE_DIR = os.getenv(
+    "TEMPO_GRANULE_CACHE_DIR", os.path.join(tempfile.gettempdir(), "tempo_granules")
+)
+
+MANIFEST_FILE = "manifest.json"
+
+
+class GranuleCache:
+    """
+    Caché incremental de granules TEMPO parseados.
+
+    `manifest.json` guarda, por cada slot producto/región, la clave S3 del
+    último granule procesado y el archivo Arrow IPC con sus columnas ya
+    limpias. En la corrida siguiente solo se descargan y parsean los slots
+    cuya clave cambió; el resto se arma desde la caché. Un granule sin filas
+    válidas (p. ej. fuera del área de interés) se registra sin archivo; un
+    DataFrame sin columnas es un error del parser y no se registra.
+    """
+
+    def __init__(self, directory=TEMPO_GRANULE_CACHE_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.manifest = self._read_manifest()
+        self._dirty = False
+
+    def _read_manifest(self):
+        try:
+            with open(os.path.join(self.directory, MANIFEST_FILE)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            logger.warning(f"⚠️ Manifest de granules ilegible, se reconstruye: {e}")
+            return {}
+
+    @staticmethod
+    def _slot(product, region):
+        return f"{product}|{region}"
+
+    def lookup(self, product, region, key):
+        """
+        DataFrame cacheado para ese granule, o None si hay que procesarlo
+        (slot nuevo, clave distinta, otras opciones de parsing o archivo perdido).
+        Un granule registrado sin filas devuelve un DataFrame vacío: el
+        llamador lo descarta igual que a un parseo nuevo vacío.
+        """
+        entry = self.manifest.get(self._slot(product, region))
+        if not entry or entry["key"] != key or entry.get("parser") != parse_signature():
+            return None
+        if not entry["file"]:
+            return pd.DataFrame()
+        path = os.path.join(self.directory, entry["file"])
+        try:
+            return read_arrow_df(path, remove=False)
+        except Exception as e:
+            logger.warning(f"⚠️ Caché de {product}-{region} inválida, se reprocesa: {e}")
+            return None
+
+    def store(self, product, region, key, df, arrow_path=None):
+        """
+        Registra un granule recién procesado. Si el worker ya escribió el
+        Arrow (modo proceso) se pasa en `arrow_path` y se mueve a la caché
+        sin reescribirlo.
+        """
+        if len(df.columns) == 0:
+            return
+
+        slot = self._slot(product, region)
+        name = None
+        if not df.empty:
+            name = os.path.basename(key) + ".arrow"
+            path = os.path.join(self.directory, name)
+            if arrow_path:
+                shutil.move(arrow_path, path)
+            else:
+                write_arrow(df, path)
+        elif arrow_path:
+            os.remove(arrow_path)
+
+        old = self.manifest.get(slot)
+        self.manifest[slot] = {
+            "key": key,
+            "file": name,
+            "rows": len(df),
+            "parser": parse_signature(),
+            "processed_at": datetime.now(timezone.utc).isoformat(),
+        }
+        self._dirty = True
+        # La clave anterior del slot ya no se va a usar
+        if old and old["file"] and old["file"] != name:
+            try:
+                os.remove(os.path.join(self.directory, old["file"]))
+            except FileNotFoundError:
+                pass
+
+    def save(self):
+        """Escribe el manifest de forma atómica (solo si hubo cambios)."""
+        if not self._dirty:
+            return
+        fd, tmp = tempfile.mkstemp(prefix=".manifest.", dir=self.directory)
+        with os.fdopen(fd, "w") as f:
+            json.dump(self.manifest, f, indent=1)
+        os.replace(tmp, os.path.join(self.directory, MANIFEST_FILE))
+        self._dirty = False
+
+
+def open_granule_cache():
+    """Caché configurada por entorno, o None si está deshabilitada o no se puede abrir."""
+    if not TEMPO_GRANULE_CACHE_DIR:
+        return None
+    try:
+        return GranuleCache(TEMPO_GRANULE_CACHE_DIR)
+    except Exception as e:
+        logger.warning(f"⚠️ Caché de granules no disponible, se procesa todo: {e}")
+        return None
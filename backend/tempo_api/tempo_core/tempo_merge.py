@@ -1,9 +1,21 @@
 import os
+import tempfile
 import boto3
 import pandas as pd
 import logging
 import sys
-from tempo_core.tempo_file_parser import tempo_file_to_df
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from tempo_core.tempo_file_parser import (
+    tempo_file_to_df,
+    tempo_file_to_arrow,
+    read_arrow_df,
+    parse_executor,
+    TEMPO_PARSE_MODE,
+    TEMPO_PARSE_PROCESSES,
+)
+from tempo_core.tempo_granule_cache import open_granule_cache
 
 # --- Configurar logger global con soporte UTF-8 ---
 if hasattr(sys.stdout, "reconfigure"):
@@ -16,72 +28,189 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# --- Pipeline de descarga/parsing ---
+# Granules descargándose a la vez
+TEMPO_DOWNLOAD_WORKERS = int(os.getenv("TEMPO_DOWNLOAD_WORKERS", "4"))
+# Partes en paralelo por granule (multipart) y tamaño de cada parte
+TEMPO_MULTIPART_CONCURRENCY = int(os.getenv("TEMPO_MULTIPART_CONCURRENCY", "4"))
+TEMPO_MULTIPART_CHUNK_MB = int(os.getenv("TEMPO_MULTIPART_CHUNK_MB", "16"))
+# Granules parseándose a la vez en modo "thread" (netCDF4/HDF5 no paraleliza
+# bien en hilos); con TEMPO_PARSE_MODE=process se usa un pool de procesos
+TEMPO_PARSE_WORKERS = int(os.getenv("TEMPO_PARSE_WORKERS", "1"))
 
-def merge_tempo_tiles(results, creds, download_dir=None):
-    import tempfile, os, boto3, pandas as pd
-    from tempo_core.tempo_file_parser import tempo_file_to_df
+PRODUCT_GROUPS = ("NO2", "O3TOT", "O3PROF", "HCHO")
 
-    # Si no se especifica, usar carpeta temporal segura
-    if download_dir is None:
-        download_dir = os.path.join(tempfile.gettempdir(), "tempo_tiles")
 
-    os.makedirs(download_dir, exist_ok=True)
+def _product_group(product):
+    for k in PRODUCT_GROUPS:
+        if k in product:
+            return k
+    return None
 
+
+def download_granule(s3, bucket, key, filename, transfer_config=None):
+    """
+    Descarga un granule a `filename` (multipart, partes en paralelo).
+    Escribe a un `.part` y lo renombra al terminar: un archivo a medio
+    bajar nunca se confunde con uno completo en la próxima corrida.
+    """
+    if os.path.exists(filename):
+        logger.info(f"📦 {filename} ya existe, se omite descarga.")
+        return filename
+
+    part = filename + ".part"
+    try:
+        s3.download_file(bucket, key, part, Config=transfer_config)
+        os.replace(part, filename)
+    finally:
+        if os.path.exists(part):
+            os.remove(part)
+    logger.info(f"✅ Descarga completa: {filename}")
+    return filename
+
+
+def merge_tempo_tiles(results, creds, download_dir=None, incremental=True):
     """
     Descarga archivos TEMPO desde S3, los procesa con `tempo_file_to_df`
     y devuelve los DataFrames combinados para cada producto (NO2, O3TOT, O3PROF, HCHO).
+
+    Pipeline productor/consumidor: las descargas corren en un pool acotado
+    (`TEMPO_DOWNLOAD_WORKERS`, multipart) y cada archivo pasa a parsearse
+    apenas termina de bajar, así red y CPU se solapan. Un granule que falla
+    (descarga o parsing) se registra y se omite sin frenar al resto.
+
+    Con `incremental=True` los granules cuya clave S3 ya se procesó en una
+    corrida anterior se toman de la caché de granules parseados
+    (`TEMPO_GRANULE_CACHE_DIR`) sin descargarlos ni parsearlos de nuevo.
     """
+    # Si no se especifica, usar carpeta temporal segura
+    if download_dir is None:
+        download_dir = os.path.join(tempfile.gettempdir(), "tempo_tiles")
 
     try:
+        download_workers = max(1, TEMPO_DOWNLOAD_WORKERS)
+        multipart_concurrency = max(1, TEMPO_MULTIPART_CONCURRENCY)
         s3 = boto3.client(
             "s3",
             aws_access_key_id=creds["accessKeyId"],
             aws_secret_access_key=creds["secretAccessKey"],
-            aws_session_token=creds["sessionToken"]
+            aws_session_token=creds["sessionToken"],
+            # Una conexión por parte en vuelo
+            config=Config(max_pool_connections=download_workers * multipart_concurrency),
+        )
+        chunk = TEMPO_MULTIPART_CHUNK_MB * 1024 * 1024
+        transfer_config = TransferConfig(
+            multipart_threshold=chunk,
+            multipart_chunksize=chunk,
+            max_concurrency=multipart_concurrency,
+            use_threads=True,
         )
 
         bucket = "asdc-prod-protected"
         os.makedirs(download_dir, exist_ok=True)
-        dfs = {"NO2": [], "O3TOT": [], "O3PROF": [], "HCHO": []}
 
-        logger.info("⬇️ Iniciando descarga y procesamiento de archivos TEMPO...")
+        cache = open_granule_cache() if incremental else None
 
-        for entry in results:
+        parsed = {}
+        failed = []
+
+        jobs = []
+        for idx, entry in enumerate(results):
             key = entry.get("Key")
             product = entry.get("product", "UNKNOWN").upper()
             region = entry.get("region", "G??")
-
             if not key:
                 logger.warning(f"⚠️ {product}-{region}: sin archivo válido, se omite.")
                 continue
+            cached = cache.lookup(product, region, key) if cache else None
+            if cached is not None:
+                # Igual que un parseo nuevo: un granule sin filas válidas no se agrega
+                if not cached.empty:
+                    parsed[idx] = (product, region, cached)
+                continue
+            jobs.append((idx, key, product, region, os.path.join(download_dir, os.path.basename(key))))
+
+        if cache:
+            logger.info(f"♻️ {len(parsed)} granules sin cambios tomados de la caché; {len(jobs)} a procesar.")
+
+        use_processes = TEMPO_PARSE_MODE == "process"
+        if use_processes:
+            # Cada worker deja su resultado como archivo Arrow en disco
+            parse_workers = max(1, TEMPO_PARSE_PROCESSES)
+            parsers = parse_executor(parse_workers)
+            arrow_dir = os.path.join(download_dir, "parsed")
+        else:
+            parse_workers = max(1, TEMPO_PARSE_WORKERS)
+            parsers = ThreadPoolExecutor(max_workers=parse_workers, thread_name_prefix="tempo-parse")
+
+        logger.info(
+            f"⬇️ Iniciando descarga y procesamiento de {len(jobs)} archivos TEMPO "
+            f"({download_workers} descargas, {parse_workers} parsers en modo {TEMPO_PARSE_MODE})..."
+        )
 
-            filename = os.path.join(download_dir, os.path.basename(key))
-
-            # --- Descargar archivo ---
-            if not os.path.exists(filename):
+        with ThreadPoolExecutor(max_workers=download_workers, thread_name_prefix="tempo-dl") as downloads, parsers:
+            # --- Productor: descargas en paralelo ---
+            download_futures = {}
+            for job in jobs:
+                idx, key, product, region, filename = job
                 logger.info(f"📥 Descargando {product}-{region} desde S3...")
+                download_futures[downloads.submit(download_granule, s3, bucket, key, filename, transfer_config)] = job
+
+            # --- Consumidor: cada archivo se parsea apenas termina de bajar ---
+            parse_futures = {}
+            for future in as_completed(download_futures):
+                idx, key, product, region, filename = job = download_futures[future]
                 try:
-                    s3.download_file(bucket, key, filename)
-                    logger.info(f"✅ Descarga completa: {filename}")
+                    future.result()
                 except Exception as e:
                     logger.error(f"💥 Error descargando {key}: {str(e)}", exc_info=True)
+                    failed.append((product, region, "download"))
                     continue
-            else:
-                logger.info(f"📦 {filename} ya existe, se omite descarga.")
-
-            # --- Convertir a DataFrame ---
-            df = tempo_file_to_df(filename, product_name=product)
-            if df.empty:
-                logger.warning(f"⚠️ {product}-{region}: sin datos válidos tras procesar.")
-                continue
-
-            # Clasificar por tipo de producto
-            for k in dfs.keys():
-                if k in product:
-                    dfs[k].append(df)
-                    logger.info(f"🧩 {product}-{region}: {len(df):,} filas añadidas.")
-                    break
+                if use_processes:
+                    parse_futures[parsers.submit(tempo_file_to_arrow, filename, product, arrow_dir)] = job
+                else:
+                    parse_futures[parsers.submit(tempo_file_to_df, filename, product)] = job
 
+            for future in as_completed(parse_futures):
+                idx, key, product, region, filename = parse_futures[future]
+                try:
+                    if use_processes:
+                        arrow_path = future.result()[0]
+                        df = read_arrow_df(arrow_path, remove=cache is None)
+                    else:
+                        arrow_path = None
+                        df = future.result()
+                except Exception as e:
+                    logger.error(f"💥 Error procesando {filename}: {str(e)}", exc_info=True)
+                    failed.append((product, region, "parse"))
+                    continue
+                if cache:
+                    try:
+                        cache.store(product, region, key, df, arrow_path=arrow_path)
+                        if len(df.columns):
+                            # Ya está en la caché: el NetCDF crudo no se vuelve a usar
+                            os.remove(filename)
+                    except Exception as e:
+                        logger.warning(f"⚠️ No se pudo cachear {product}-{region}: {e}")
+                if df.empty:
+                    logger.warning(f"⚠️ {product}-{region}: sin datos válidos tras procesar.")
+                    continue
+                parsed[idx] = (product, region, df)
+
+        if cache:
+            cache.save()
+
+        # Clasificar por tipo de producto, en el orden original de `results`
+        dfs = {k: [] for k in PRODUCT_GROUPS}
+        for idx in sorted(parsed):
+            product, region, df = parsed[idx]
+            group = _product_group(product)
+            if group is not None:
+                dfs[group].append(df)
+                logger.info(f"🧩 {product}-{region}: {len(df):,} filas añadidas.")
+
+        if failed:
+            logger.warning(f"⚠️ {len(failed)} granules omitidos por errores: {failed}")
         logger.info("✅ Descarga y procesamiento completados. Uniendo DataFrames...")
 
         return (
@@ -2,6 +2,7 @@ import React, { useEffect, useMemo, useState } from 'react'
 import { MapContainer, TileLayer, Marker, useMapEvents } from 'react-leaflet'
 import L from 'leaflet'
 import 'leaflet/dist/leaflet.css'
+import { BASE_URL } from '../api'
 
 import markerIcon2xUrl from 'leaflet/dist/images/marker-icon-2x.png'
 import markerIconUrl from 'leaflet/dist/images/marker-icon.png'
@@ -54,6 +55,11 @@ export default function MapPicker({ onPick }) {
           attribution='&copy; <a href="https://www.openstreetmap.org/copyright">OpenStreetMap</a> contributors'
           url="https://{s}.tile.openstreetmap.org/{z}/{x}/{y}.png"
         />
+        <TileLayer
+          url={`${BASE_URL}/tiles/aqi/{z}/{x}/{y}?format=png`}
+          opacity={0.6}
+          maxNativeZoom={12}
+        />
         <ClickHandler onPick={({ latitude, longitude }) => setPosition({ lat: latitude, lng: longitude })} />
         {position && <Marker position={position} />}
       </MapContainer>